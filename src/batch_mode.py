@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import hashlib
+
+import openai
+from openai.api_resources.abstract import CreateableAPIResource, ListableAPIResource
+
+from gpt_client import chat_completion
+from response_cache import cache_key, get_cache
+from jsonl_io import JsonlWriter, iter_jsonl
+from parallel import ordered_imap
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+BATCH_DIR = os.path.join(DATA_DIR, "batch")
+
+# off — обычные интерактивные вызовы; local — файл пакета обрабатывается на месте
+# через chat_completion (с кешем и лимитами); openai — файл отправляется в Batch API
+BATCH_MODE = os.getenv("BATCH_MODE", "off")
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class Batch(CreateableAPIResource, ListableAPIResource):
+    """Ресурс /v1/batches в стиле openai 0.27 — в этой версии SDK его нет."""
+    OBJECT_NAME = "batches"
+
+
+def batch_enabled():
+    return BATCH_MODE != "off"
+
+
+def batch_paths(name):
+    return (
+        os.path.join(BATCH_DIR, f"{name}_requests.jsonl"),
+        os.path.join(BATCH_DIR, f"{name}_results.jsonl"),
+        os.path.join(BATCH_DIR, f"{name}_state.json"),
+    )
+
+
+def write_requests(file_path, requests):
+    """
+    Пишет пары (custom_id, аргументы ChatCompletion) в формате Batch API.
+    Возвращает (sha256 файла, число запросов).
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with JsonlWriter(file_path) as writer:
+        for custom_id, body in requests:
+            writer.write({"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body})
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest(), writer.count
+
+
+def process_locally(stage, requests_file, results_file, max_workers=BATCH_WORKERS):
+    """Локальная замена Batch API: тот же формат входа и выхода, вызовы через chat_completion."""
+    def run(line):
+        try:
+            body = chat_completion(stage=stage, **line["body"])
+            return {"custom_id": line["custom_id"],
+                    "response": {"status_code": 200, "body": body}, "error": None}
+        except Exception as e:
+            return {"custom_id": line["custom_id"], "response": None,
+                    "error": {"code": type(e).__name__, "message": str(e)}}
+
+    with JsonlWriter(results_file) as writer:
+        for result in ordered_imap(run, iter_jsonl(requests_file), max_workers):
+            writer.write(result)
+
+
+def _load_state(state_file):
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def process_remotely(stage, requests_file, results_file, state_file, digest):
+    """
+    Загружает файл в Batch API и ждёт завершения. id пакета сохраняется рядом,
+    поэтому перезапуск с тем же файлом запросов продолжает ждать тот же пакет.
+    """
+    state = _load_state(state_file)
+    if state.get("input_sha256") == digest:
+        batch_id = state["batch_id"]
+        print(f"⏳ [{stage}] продовжуємо чекати пакет {batch_id}")
+    else:
+        with open(requests_file, "rb") as f:
+            uploaded = openai.File.create(file=f, purpose="batch")
+        batch = Batch.create(
+            input_file_id=uploaded["id"],
+            endpoint=ENDPOINT,
+            completion_window=COMPLETION_WINDOW,
+            metadata={"stage": stage}
+        )
+        batch_id = batch["id"]
+        with open(state_file, "w", encoding="utf-8") as f:
+            json.dump({"batch_id": batch_id, "input_sha256": digest}, f)
+        print(f"📤 [{stage}] пакет {batch_id} відправлено")
+
+    while True:
+        batch = Batch.retrieve(batch_id)
+        if batch["status"] in FINAL_STATUSES:
+            break
+        counts = batch.get("request_counts") or {}
+        print(f"⏳ [{stage}] {batch['status']}: {counts.get('completed', 0)}/{counts.get('total', '?')}")
+        time.sleep(POLL_SECONDS)
+
+    if batch["status"] != "completed":
+        os.remove(state_file)
+        raise RuntimeError(f"Пакет {batch_id} завершився зі статусом {batch['status']}")
+
+    content = b""
+    for key in ("output_file_id", "error_file_id"):
+        if batch.get(key):
+            content += openai.File.download(batch[key])
+    with open(results_file, "wb") as f:
+        f.write(content)
+    os.remove(state_file)
+
+    # Ответы пакета попадают в кеш, как если бы запросы шли по одному
+    cache = get_cache()
+    bodies = {line["custom_id"]: line["body"] for line in iter_jsonl(requests_file)}
+    for result in iter_jsonl(results_file):
+        response = result.get("response") or {}
+        if response.get("status_code") == 200 and result["custom_id"] in bodies:
+            cache.put(cache_key(bodies[result["custom_id"]]), response["body"])
+
+
+def collect_results(results_file):
+    """{custom_id: тело ответа ChatCompletion}; неудачные запросы — None."""
+    results = {}
+    for result in iter_jsonl(results_file):
+        response = result.get("response") or {}
+        if response.get("status_code") == 200:
+            results[result["custom_id"]] = response["body"]
+        else:
+            error = result.get("error") or response.get("body", {}).get("error")
+            print(f"❌ {result['custom_id']}: {error}")
+            results[result["custom_id"]] = None
+    return results
+
+
+def run_batch(stage, requests, name=None):
+    """
+    Выполняет пары (custom_id, аргументы chat_completion) одним пакетом и
+    возвращает {custom_id: ответ или None}. name различает файлы раундов одной стадии.
+    """
+    name = name or stage
+    requests_file, results_file, state_file = batch_paths(name)
+    digest, count = write_requests(requests_file, requests)
+    if not count:
+        return {}
+    print(f"📦 [{stage}] {count} запитів у {requests_file}")
+
+    if BATCH_MODE == "local":
+        process_locally(stage, requests_file, results_file)
+    elif BATCH_MODE == "openai":
+        process_remotely(stage, requests_file, results_file, state_file, digest)
+    else:
+        raise ValueError(f"Невідомий BATCH_MODE: {BATCH_MODE}")
+    return collect_results(results_file)
+
+
+def response_text(response):
+    return response["choices"][0]["message"]["content"].strip()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import random
+import timeit
+import platform
+import tempfile
+import contextlib
+import statistics
+
+# Замеры работают без сети и не должны ни читать, ни засорять кеш ответов
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ["GPT_CACHE_MODE"] = "bypass"
+
+import gpt_client
+from fake_llm import FakeChatCompletion, CLIENT_OPENERS, CLIENT_REPLIES
+from jsonl_io import JsonlWriter, write_json_array
+from intents import classify
+from generate_persons import load_cities, pick_city, generate_person, generate_person_at, iter_persons
+import generate_prompts
+from generate_prompts import PromptTemplate
+from refine_prompts import refine_prompt_logic
+from refine_dialogues import extract_json
+from generate_dialogues import (
+    create_dialogue,
+    load_file,
+    is_goodbye,
+    is_price_inquiry,
+    is_refusal,
+    check_success,
+    BOT_PROMPT_FILE
+)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+# История прогонов (по записи на прогон) и базовая линия для сравнения
+RESULTS_FILE = os.path.join(DATA_DIR, "benchmarks.jsonl")
+BASELINE_FILE = os.path.join(DATA_DIR, "benchmark_baseline.json")
+
+# Замер — лучший из REPEAT прогонов пачки, как в timeit
+REPEAT = int(os.getenv("BENCH_REPEAT", "5"))
+# Допустимое замедление относительно базовой линии
+REGRESSION_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+
+# Бюджет CPU на миллион элементов, секунды (численно равен мкс на элемент): при
+# превышении накладные расходы стадии уже заметны на масштабе 1M. Запас — в 3–5 раз
+BUDGETS_PER_MILLION = {
+    "pick_city": 2,
+    "generate_person": 25,
+    "generate_person_at": 50,
+    "iter_persons": 40,
+    "render_prompt": 40,
+    "generate_prompts": 100,
+    "refine_prompt_logic": 10,
+    "classify": 10,
+    "keyword_helpers": 40,
+    "extract_json": 40,
+    "extract_json_wrapped": 80,
+    "create_dialogue": 3000,
+}
+
+LONG_MESSAGES = [
+    "Добрий день, я зараз на роботі, але коротко: скільки коштує заняття і де ви знаходитесь?",
+    "Мені здається, що дитині це не потрібно, у неї і так багато гуртків, тому ні, дякую.",
+    "Звучить цікаво, хочу спробувати пробний урок для сина, запишіть нас, будь ласка.",
+    "Добре, я подумаю над цим і, можливо, передзвоню пізніше. До побачення!",
+]
+
+
+def sample_dialogue(turns=20):
+    dialogue = []
+    for i in range(turns):
+        role = "sales_bot" if i % 2 == 0 else "client"
+        messages = LONG_MESSAGES if role == "client" else CLIENT_REPLIES
+        dialogue.append({"role": role, "message": messages[i % len(messages)]})
+    return {"dialogue": dialogue}
+
+
+class Case:
+    """Замер: prepare(n) готовит данные и возвращает функцию, обрабатывающую n элементов."""
+
+    def __init__(self, name, items, prepare):
+        self.name = name
+        self.items = items
+        self.prepare = prepare
+
+
+def _persons(n, seed=1):
+    sampler = load_cities()
+    rng = random.Random(seed)
+    return [generate_person(sampler, rng) for _ in range(n)]
+
+
+def prepare_pick_city(n):
+    sampler = load_cities()
+    rng = random.Random(1)
+    return lambda: [pick_city(sampler, rng) for _ in range(n)]
+
+
+def prepare_generate_person(n):
+    sampler = load_cities()
+    rng = random.Random(1)
+    return lambda: [generate_person(sampler, rng) for _ in range(n)]
+
+
+def prepare_generate_person_at(n):
+    sampler = load_cities()
+    return lambda: [generate_person_at(i, sampler, 1) for i in range(n)]
+
+
+def prepare_iter_persons(n):
+    sampler = load_cities()
+    return lambda: list(iter_persons(n, sampler, seed=1))
+
+
+def prepare_render_prompt(n):
+    persons = _persons(n)
+    template = PromptTemplate()
+    return lambda: list(template.render_all(persons, seed=1))
+
+
+def prepare_generate_prompts(n):
+    """Вся стадия: чтение persons.json, рендер и запись prompts.json во временный каталог."""
+    tmp = tempfile.mkdtemp(prefix="bench_prompts_")
+    atexit.register(shutil.rmtree, tmp, True)
+    persons_file = os.path.join(tmp, "persons.json")
+    write_json_array(_persons(n), persons_file)
+
+    def run():
+        saved = generate_prompts.PERSONS_FILE, generate_prompts.OUTPUT_FILE, sys.argv
+        generate_prompts.PERSONS_FILE = persons_file
+        generate_prompts.OUTPUT_FILE = os.path.join(tmp, "prompts.json")
+        sys.argv = [sys.argv[0], str(n)]
+        try:
+            generate_prompts.generate_prompts()
+        finally:
+            generate_prompts.PERSONS_FILE, generate_prompts.OUTPUT_FILE, sys.argv = saved
+    return run
+
+
+def prepare_refine_prompt_logic(n):
+    texts = [p["text"] for p in PromptTemplate().render_all(_persons(min(n, 2000)), seed=1)]
+    texts = [texts[i % len(texts)] for i in range(n)]
+    return lambda: [refine_prompt_logic(text) for text in texts]
+
+
+def _messages(n):
+    messages = CLIENT_OPENERS + CLIENT_REPLIES + LONG_MESSAGES
+    return [messages[i % len(messages)] for i in range(n)]
+
+
+def prepare_classify(n):
+    messages = _messages(n)
+    return lambda: [classify(text) for text in messages]
+
+
+def prepare_keyword_helpers(n):
+    messages = _messages(n)
+
+    def run():
+        for text in messages:
+            is_goodbye(text)
+            is_price_inquiry(text)
+            is_refusal(text)
+            check_success(text)
+    return run
+
+
+def prepare_extract_json(n):
+    text = json.dumps(sample_dialogue(), ensure_ascii=False, indent=2)
+    return lambda: [extract_json(text) for _ in range(n)]
+
+
+def prepare_extract_json_wrapped(n):
+    # Ответ модели с пояснением вокруг JSON: срабатывает поиск через raw_decode
+    text = ("Ось покращений діалог (формат {\"dialogue\": [...]}):\n```json\n"
+            + json.dumps(sample_dialogue(), ensure_ascii=False, indent=2) + "\n```\nГотово.")
+    return lambda: [extract_json(text) for _ in range(n)]
+
+
+def prepare_create_dialogue(n):
+    bot_prompt = load_file(BOT_PROMPT_FILE)
+    prompts = list(PromptTemplate().render_all(_persons(n), seed=1))
+    backend = FakeChatCompletion(latency=0.0)
+    gpt_client.set_backend(backend.create)
+    gpt_client.BACKOFF_BASE = 0.0
+
+    def run():
+        # Журнал отдельных диалогов в замере не нужен
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for i, prompt in enumerate(prompts):
+                create_dialogue(prompt, bot_prompt, i, 1)
+    return run
+
+
+CASES = [
+    Case("pick_city", 200_000, prepare_pick_city),
+    Case("generate_person", 20_000, prepare_generate_person),
+    Case("generate_person_at", 20_000, prepare_generate_person_at),
+    Case("iter_persons", 20_000, prepare_iter_persons),
+    Case("render_prompt", 20_000, prepare_render_prompt),
+    Case("generate_prompts", 5_000, prepare_generate_prompts),
+    Case("refine_prompt_logic", 50_000, prepare_refine_prompt_logic),
+    Case("classify", 100_000, prepare_classify),
+    Case("keyword_helpers", 50_000, prepare_keyword_helpers),
+    Case("extract_json", 5_000, prepare_extract_json),
+    Case("extract_json_wrapped", 5_000, prepare_extract_json_wrapped),
+    Case("create_dialogue", 200, prepare_create_dialogue),
+]
+
+
+def run_case(case, scale=1.0, repeat=REPEAT):
+    items = max(1, int(case.items * scale))
+    run = case.prepare(items)
+    run()  # прогрев: ленивые загрузки, кеши regex и т.п.
+    timings = timeit.Timer(run).repeat(repeat=repeat, number=1)
+    per_item_us = min(timings) / items * 1e6
+    budget = BUDGETS_PER_MILLION.get(case.name)
+    return {
+        "items": items,
+        "per_item_us": round(per_item_us, 3),
+        "median_us": round(statistics.median(timings) / items * 1e6, 3),
+        "budget_per_million_s": budget,
+        "over_budget": budget is not None and per_item_us > budget,
+    }
+
+
+def load_baseline(file_path=BASELINE_FILE):
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Отмечает замедление больше чем на tolerance относительно базовой линии."""
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = result["per_item_us"] / base["per_item_us"]
+        result["baseline_us"] = base["per_item_us"]
+        result["ratio"] = round(ratio, 3)
+        result["regression"] = ratio > 1 + tolerance
+
+
+def run_benchmarks(names=None, scale=1.0, save_baseline=False):
+    """
+    Прогоняет замеры (все или names), дописывает прогон в RESULTS_FILE и
+    возвращает его; при save_baseline результаты становятся базовой линией.
+    """
+    cases = [case for case in CASES if not names or case.name in names]
+    results = {}
+    for case in cases:
+        print(f"⏱ {case.name}...", flush=True)
+        results[case.name] = run_case(case, scale)
+    compare(results, load_baseline())
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "results": results,
+    }
+    with JsonlWriter(RESULTS_FILE, "a") as writer:
+        writer.write(run)
+    if save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(run, f, ensure_ascii=False, indent=4)
+        print(f"📌 Базову лінію збережено у {BASELINE_FILE}")
+    return run
+
+
+def report(run):
+    failed = False
+    print(f"\n📊 Python {run['python']}, масштаб {run['scale']} (мкс на елемент = с на мільйон)")
+    for name, result in run["results"].items():
+        flags = []
+        if result["over_budget"]:
+            flags.append(f"понад бюджет {result['budget_per_million_s']} с/1M")
+        if result.get("regression"):
+            flags.append(f"повільніше за базову лінію у {result['ratio']:.2f} раза")
+        elif "ratio" in result:
+            flags.append(f"×{result['ratio']:.2f} до базової лінії")
+        failed |= result["over_budget"] or result.get("regression", False)
+        mark = "❌" if result["over_budget"] or result.get("regression") else "✅"
+        print(f"  {mark} {name:<22} {result['per_item_us']:>10.2f} мкс  "
+              f"(бюджет {result['budget_per_million_s']})  {'; '.join(flags)}")
+    return not failed
+
+
+def main():
+    args = sys.argv[1:]
+    save_baseline = "--save-baseline" in args
+    # --quick: пачки в 10 раз меньше, для быстрой проверки
+    scale = 0.1 if "--quick" in args else 1.0
+    names = [a for a in args if not a.startswith("--")]
+    unknown = set(names) - {case.name for case in CASES}
+    if unknown:
+        print(f"❌ Невідомі замери: {', '.join(sorted(unknown))}")
+        sys.exit(2)
+
+    run = run_benchmarks(names, scale, save_baseline)
+    ok = report(run)
+    print(f"\nРезультати дописано у {RESULTS_FILE}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import random
+import struct
+from array import array
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+CITIES_FILE = os.path.join(DATA_DIR, "cities_output.json")
+SAMPLER_FILE = os.path.join(DATA_DIR, "cities_sampler.bin")
+
+UNKNOWN_CITY = ("Невідоме місто", "Невідома країна")
+
+_MAGIC = b"CSMP"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHI")   # magic, версия, число городов
+_LENGTH = struct.Struct("<H")      # длина строки в байтах
+
+
+def clean_variant(variant):
+    return re.sub(r'^[0-9]+\)\s*', '', variant).strip()
+
+
+def build_alias_table(weights):
+    """Метод Уокера (вариант Воуза): таблицы prob и alias для выборки за O(1)."""
+    n = len(weights)
+    total = float(sum(weights))
+    prob = array("d", [0.0] * n)
+    alias = array("I", range(n))
+    if n == 0 or total <= 0:
+        return prob, alias
+
+    scaled = [w * n / total for w in weights]
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = (scaled[l] + scaled[s]) - 1.0
+        (small if scaled[l] < 1.0 else large).append(l)
+    for i in large + small:
+        prob[i] = 1.0
+    return prob, alias
+
+
+class CitySampler:
+    """
+    Выборка города пропорционально населению за O(1) независимо от числа городов.
+    Варианты названий хранятся уже очищенными от нумерации «1) » и пробелов.
+    """
+
+    def __init__(self, variants, countries, prob, alias):
+        self.variants = variants
+        self.countries = countries
+        self.prob = prob
+        self.alias = alias
+        self.size = len(variants)
+        self.empty = self.size == 0 or not any(prob)
+
+    @classmethod
+    def from_cities_data(cls, data):
+        variants = []
+        countries = []
+        weights = []
+        for city_key, city_info in data.items():
+            names = [clean_variant(v) for v in city_info.get("city", [])] or [city_key]
+            variants.append(tuple(names))
+            countries.append(city_info.get("country", "Невідома країна"))
+            weights.append(city_info.get("probability", 0.0))
+        prob, alias = build_alias_table(weights)
+        return cls(variants, countries, prob, alias)
+
+    def sample(self, rng=random):
+        if self.empty:
+            return UNKNOWN_CITY
+        i = int(rng.random() * self.size)
+        if rng.random() >= self.prob[i]:
+            i = self.alias[i]
+        names = self.variants[i]
+        return names[int(rng.random() * len(names))], self.countries[i]
+
+    def sample_many(self, k, rng=random):
+        return [self.sample(rng) for _ in range(k)]
+
+    def save(self, file_path=SAMPLER_FILE):
+        """
+        Компактный бинарный формат: заголовок, массивы prob (float64) и alias (uint32),
+        затем для каждого города страна и варианты как строки UTF-8 с длиной.
+        """
+        strings = []
+        for names, country in zip(self.variants, self.countries):
+            strings.append(struct.pack("<B", len(names)))
+            for s in (country,) + names:
+                raw = s.encode("utf-8")
+                strings.append(_LENGTH.pack(len(raw)) + raw)
+        with open(file_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.size))
+            self.prob.tofile(f)
+            self.alias.tofile(f)
+            f.write(b"".join(strings))
+
+    @classmethod
+    def load(cls, file_path=SAMPLER_FILE):
+        with open(file_path, "rb") as f:
+            data = f.read()
+        magic, version, n = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Невідомий формат {file_path}")
+        offset = _HEADER.size
+        prob = array("d")
+        prob.frombytes(data[offset:offset + 8 * n])
+        offset += 8 * n
+        alias = array("I")
+        alias.frombytes(data[offset:offset + alias.itemsize * n])
+        offset += alias.itemsize * n
+
+        def read_string():
+            nonlocal offset
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            s = data[offset:offset + length].decode("utf-8")
+            offset += length
+            return s
+
+        variants = []
+        countries = []
+        for _ in range(n):
+            count = data[offset]
+            offset += 1
+            countries.append(read_string())
+            variants.append(tuple(read_string() for _ in range(count)))
+        return cls(variants, countries, prob, alias)
+
+
+def load_city_sampler(cities_file=CITIES_FILE, sampler_file=SAMPLER_FILE):
+    """
+    Берёт готовую таблицу из sampler_file, если она новее cities_file;
+    иначе строит её из JSON и сохраняет для следующих запусков.
+    """
+    if not os.path.exists(cities_file):
+        print(f"❌ Файл {cities_file} не знайдено!")
+        return CitySampler([], [], array("d"), array("I"))
+
+    if (os.path.exists(sampler_file)
+            and os.path.getmtime(sampler_file) >= os.path.getmtime(cities_file)):
+        try:
+            return CitySampler.load(sampler_file)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            print(f"⚠️ Не вдалося прочитати {sampler_file}: {e}, перебудовуємо")
+
+    with open(cities_file, "r", encoding="utf-8") as f:
+        sampler = CitySampler.from_cities_data(json.load(f) or {})
+    try:
+        sampler.save(sampler_file)
+    except OSError as e:
+        print(f"⚠️ Не вдалося зберегти {sampler_file}: {e}")
+    return sampler
@@ -0,0 +1,85 @@
+import os
+import json
+
+from response_cache import is_cache_hit
+
+# Сколько последних реплик отправлять целиком; 0 — весь контекст, как раньше
+CONTEXT_WINDOW_TURNS = int(os.getenv("CONTEXT_WINDOW_TURNS", "0"))
+# Старые реплики сворачиваются в сводку блоками, чтобы префикс запроса
+# менялся лишь раз в SUMMARY_BLOCK_TURNS реплик и кеш промптов у провайдера работал
+SUMMARY_BLOCK_TURNS = int(os.getenv("SUMMARY_BLOCK_TURNS", "6"))
+SUMMARY_TURN_CHARS = 160
+
+SPEAKERS = {"assistant": "Бот", "user": "Клієнт"}
+
+
+def _summarize_turn(message):
+    content = (message.get("content") or "").strip()
+    speaker = SPEAKERS.get(message.get("role"), message.get("role"))
+    try:
+        call = json.loads(content).get("function_call") if content.startswith("{") else None
+    except (json.JSONDecodeError, AttributeError):
+        call = None
+    if call:
+        args = ", ".join(f"{k}={v}" for k, v in (call.get("arguments") or {}).items())
+        return f"{speaker} викликав {call.get('name')}({args})"
+    if len(content) > SUMMARY_TURN_CHARS:
+        content = content[:SUMMARY_TURN_CHARS].rsplit(" ", 1)[0] + "…"
+    return f"{speaker}: {content}"
+
+
+def summarize_turns(turns):
+    """Локальная экстрактивная сводка без вызова LLM: по строке на реплику."""
+    return "\n".join(_summarize_turn(m) for m in turns)
+
+
+def build_messages(context, window=CONTEXT_WINDOW_TURNS, block=SUMMARY_BLOCK_TURNS):
+    """
+    Сообщения для запроса: системный промпт всегда первым и без изменений
+    (стабильный префикс), затем сводка старых реплик и последние window реплик.
+    """
+    if not window or len(context) - 1 <= window:
+        return context
+    system, turns = context[0], context[1:]
+    overflow = len(turns) - window
+    folded = min(len(turns), -(-overflow // block) * block)
+    summary = {
+        "role": "system",
+        "content": "Стислий зміст попередньої частини розмови:\n" + summarize_turns(turns[:folded])
+    }
+    return [system, summary] + turns[folded:]
+
+
+def new_usage():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "calls_cached": 0}
+
+
+def add_usage(total, usage):
+    for key, value in usage.items():
+        total[key] = total.get(key, 0) + value
+
+
+def format_usage(usage):
+    return (
+        f"викликів {usage['calls']}, вхідних токенів {usage['prompt_tokens']} "
+        f"(з кешу провайдера {usage['cached_tokens']}), вихідних {usage['completion_tokens']}, "
+        f"відповідей з локального кешу {usage.get('calls_cached', 0)}"
+    )
+
+
+def record_usage(usage, response):
+    """
+    Добавляет usage ответа ChatCompletion к счётчикам диалога. Ответы из
+    локального кеша считаются отдельно и в вызовы и токены не входят, как в metrics.
+    """
+    if is_cache_hit(response):
+        usage["calls_cached"] = usage.get("calls_cached", 0) + 1
+        return
+    usage["calls"] += 1
+    reported = response.get("usage") if response else None
+    if not reported:
+        return
+    usage["prompt_tokens"] += reported.get("prompt_tokens", 0)
+    usage["completion_tokens"] += reported.get("completion_tokens", 0)
+    details = reported.get("prompt_tokens_details") or {}
+    usage["cached_tokens"] += details.get("cached_tokens", 0)
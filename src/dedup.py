@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import random
+import hashlib
+from array import array
+
+from jsonl_io import JsonlWriter
+from dialogue_store import open_dialogues
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+DIALOGUES_FILE = os.path.join(DATA_DIR, "dialogues.jsonl")
+CLUSTERS_FILE = os.path.join(DATA_DIR, "dialogue_clusters.jsonl")
+
+# Оценка сходства по Жаккару, начиная с которой диалог считается почти копией
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+# 16 полос по 4 строки: кандидатом становится пара с J ≈ 0.5 и выше,
+# окончательное решение — по оценке J из полной сигнатуры
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_WORD = re.compile(r"\w+")
+# Простое Мерсенна 2^61 − 1: строки сигнатуры — универсальные хеши (a·h + b) mod P
+_PRIME = (1 << 61) - 1
+# Фиксированный сид: сигнатуры и кластеры одинаковы от запуска к запуску
+_PERMUTATIONS = [
+    (rng.randrange(1, _PRIME), rng.randrange(_PRIME))
+    for rng in (random.Random(f"minhash:{i}") for i in range(NUM_PERM))
+]
+
+
+def shingles(dialogue, k=SHINGLE_WORDS):
+    """Множество k-словных шинглов по репликам (шинглы не переходят через границу реплики)."""
+    result = set()
+    for turn in dialogue:
+        words = _WORD.findall((turn.get("message") or "").lower())
+        if len(words) <= k:
+            if words:
+                result.add(" ".join(words))
+            continue
+        for i in range(len(words) - k + 1):
+            result.add(" ".join(words[i:i + k]))
+    return result
+
+
+def _hash61(shingle):
+    digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % _PRIME
+
+
+def minhash(shingle_set):
+    """
+    Сигнатура MinHash из NUM_PERM значений. Шингл хешируется один раз, а
+    строка i — минимум универсального хеша (a_i·h + b_i) mod P: в отличие от
+    XOR с маской, строки почти независимы и оценка J по ним несмещённая.
+    """
+    hashes = [_hash61(s) for s in shingle_set] or [0]
+    return array("Q", [min([(a * h + b) % _PRIME for h in hashes]) for a, b in _PERMUTATIONS])
+
+
+def estimate_similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """
+    Потоковая кластеризация с лидером: первый диалог кластера становится его
+    представителем и попадает в LSH-корзины, следующие сравниваются только с
+    представителями из своих корзин. Время и память линейны по числу диалогов.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._buckets = [{} for _ in range(BANDS)]
+        self._leaders = {}
+        self.count = 0
+        self.duplicates = 0
+
+    def add(self, key, dialogue):
+        """Возвращает (cluster_id, оценка сходства с лидером или None для нового кластера)."""
+        signature = minhash(shingles(dialogue))
+        bands = [signature[b * ROWS:(b + 1) * ROWS].tobytes() for b in range(BANDS)]
+        self.count += 1
+
+        best, best_similarity = None, 0.0
+        checked = set()
+        for bucket, band in zip(self._buckets, bands):
+            leader = bucket.get(band)
+            if leader is None or leader in checked:
+                continue
+            checked.add(leader)
+            similarity = estimate_similarity(signature, self._leaders[leader])
+            if similarity > best_similarity:
+                best, best_similarity = leader, similarity
+        if best is not None and best_similarity >= self.threshold:
+            self.duplicates += 1
+            return best, best_similarity
+
+        self._leaders[key] = signature
+        for bucket, band in zip(self._buckets, bands):
+            bucket.setdefault(band, key)
+        return key, None
+
+
+def dedup_stage(dialogues, drop=False, clusters_file=CLUSTERS_FILE, threshold=DEDUP_THRESHOLD):
+    """
+    Генератор-фильтр для конвейера: пишет кластер каждого диалога в clusters_file
+    и при drop=True пропускает дальше только представителей кластеров.
+    """
+    index = NearDuplicateIndex(threshold)
+    with JsonlWriter(clusters_file) as writer:
+        for i, dlg in enumerate(dialogues):
+            conversation_id = dlg.get("conversation_id", f"dialogue_{i}")
+            cluster_id, similarity = index.add(conversation_id, dlg.get("dialogue") or [])
+            writer.write({
+                "conversation_id": conversation_id,
+                "cluster_id": cluster_id,
+                "duplicate": similarity is not None,
+                "similarity": similarity
+            })
+            if similarity is None or not drop:
+                yield dlg
+    print(f"🧬 Дублікатів {index.duplicates} з {index.count} діалогів "
+          f"(поріг {threshold}), кластери у {clusters_file}")
+
+
+def dedup_dialogues(input_file=DIALOGUES_FILE, drop=False):
+    """
+    Отдельный запуск: кластеры в CLUSTERS_FILE, при drop — ещё и файл
+    <stem>_dedup.jsonl только с представителями кластеров.
+    """
+    dialogues = dedup_stage(open_dialogues(input_file), drop)
+    if not drop:
+        for _ in dialogues:
+            pass
+        return None
+    stem = os.path.basename(input_file).split(".")[0]
+    output_file = os.path.join(DATA_DIR, f"{stem}_dedup.jsonl")
+    with JsonlWriter(output_file) as writer:
+        for dlg in dialogues:
+            writer.write(dlg)
+    print(f"✅ Збережено {writer.count} унікальних діалогів у {output_file}")
+    return output_file
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--drop"]
+    dedup_dialogues(args[0] if args else DIALOGUES_FILE, drop="--drop" in sys.argv[1:])
@@ -1,16 +1,30 @@
 import json
 
-_dialogue_stopped = False
+class DialogueState:
+    """
+    Состояние одного диалога. Каждый create_dialogue получает свой экземпляр,
+    чтобы параллельные диалоги не портили друг другу флаг остановки и get_price.
+    """
 
-def reset_dialogue_state():
-    global _dialogue_stopped
-    _dialogue_stopped = False
+    def __init__(self):
+        self.stopped = False
+        self.previous_get_price_params = None
 
-def stop_dialogue(reason: str):
-    global _dialogue_stopped
-    if _dialogue_stopped:
+_default_state = DialogueState()
+
+def reset_dialogue_state(state=None):
+    global _default_state
+    if state is None:
+        _default_state = DialogueState()
+    else:
+        state.stopped = False
+        state.previous_get_price_params = None
+
+def stop_dialogue(reason: str, state=None):
+    state = state or _default_state
+    if state.stopped:
         return
-    _dialogue_stopped = True
+    state.stopped = True
     print(f"🛑 stop_dialogue викликано з причиною: {reason}\n")
     return {"function_call": {"name": "stop_dialogue", "arguments": {"reason": reason}}}
 
@@ -73,13 +87,13 @@ sign_for_promo_schema = {
 def generate_get_price_json(city="Dnipro", online=False):
     return json.dumps(get_price(city, online), ensure_ascii=False, indent=4)
 
-def generate_stop_dialogue_json(reason="друга відмова"):
-    return json.dumps(stop_dialogue(reason), ensure_ascii=False, indent=4)
+def generate_stop_dialogue_json(reason="друга відмова", state=None):
+    return json.dumps(stop_dialogue(reason, state), ensure_ascii=False, indent=4)
 
 def generate_sign_for_promo_json(city="Dnipro", child_name="Нонейм", phone="12345678"):
     return json.dumps(sign_for_promo(city, child_name, phone), ensure_ascii=False, indent=4)
 
-def handle_ai_function_call(choice):
+def handle_ai_function_call(choice, state=None):
     if "message" not in choice:
         return False
     msg = choice["message"]
@@ -91,7 +105,7 @@ def handle_ai_function_call(choice):
 
         if name == "stop_dialogue":
             reason = args.get("reason", "")
-            return stop_dialogue(reason)
+            return stop_dialogue(reason, state)
         elif name == "get_price":
             city = args.get("city", "Dnipro")
             online = args.get("online", False)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import mmap
+import struct
+from collections import defaultdict
+
+from jsonl_io import JsonlWriter, iter_jsonl, iter_records
+from persona_store import PersonaLookup
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+DIALOGUES_FILE = os.path.join(DATA_DIR, "dialogues.jsonl")
+
+MAGIC = b"DLGS"
+VERSION = 1
+HEADER = struct.Struct("<4sH")
+LENGTH = struct.Struct("<I")
+
+# Атрибуты со вторичным индексом: итог диалога и поля персоны (по person_id)
+OUTCOME_ATTRIBUTES = ("success", "refusal_count", "refine_status", "prompt_index", "person_id")
+PERSONA_ATTRIBUTES = ("city", "country", "gender", "age", "interest", "tone", "mood", "profession")
+
+
+def store_path(input_file):
+    """Хранилище для файла диалогов: dialogues.jsonl → dialogues.store."""
+    stem = os.path.basename(input_file).split(".")[0]
+    return os.path.join(os.path.dirname(input_file), f"{stem}.store")
+
+
+def index_path(store_file):
+    return store_file + ".idx"
+
+
+STORE_FILE = store_path(DIALOGUES_FILE)
+
+
+def dialogue_attributes(record, person=None):
+    attrs = {name: record.get(name) for name in OUTCOME_ATTRIBUTES if record.get(name) is not None}
+    if person:
+        attrs.update({name: person[name] for name in PERSONA_ATTRIBUTES if name in person})
+    return attrs
+
+
+class DialogueStore:
+    """
+    Хранилище диалогов только на добавление: в файле данных записи идут подряд как
+    длина (uint32) + JSON в UTF-8, файл читается через mmap. Рядом лежит индекс
+    (JSONL: conversation_id, смещение, длина, атрибуты), из которого в памяти строятся
+    поиск по conversation_id за O(1) и вторичные индексы по атрибутам.
+
+    Запись индекса идёт после записи данных. Если при обрыве данные успели
+    записаться, а строка индекса нет, при открытии целые записи хвоста
+    индексируются заново (без атрибутов персоны), а оборванная — отбрасывается.
+    """
+
+    def __init__(self, file_path=STORE_FILE, read_only=False):
+        self.file_path = file_path
+        self.read_only = read_only
+        self._ids = []
+        self._offsets = []
+        self._lengths = []
+        self._positions = {}
+        self._by_attr = defaultdict(lambda: defaultdict(list))
+        self._mm = None
+        self._mapped_size = 0
+        # Прежние отображения: на них могут ссылаться memoryview из raw()
+        self._retired_maps = []
+        self._data = None
+        self._index = None
+
+        if os.path.exists(file_path):
+            with open(file_path, "rb") as f:
+                magic, version = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Невідомий формат сховища {file_path}")
+            if os.path.exists(index_path(file_path)):
+                for entry in iter_jsonl(index_path(file_path)):
+                    self._add(entry["id"], entry["offset"], entry["length"], entry.get("attrs") or {})
+            end = self._offsets[-1] + LENGTH.size + self._lengths[-1] if self._ids else HEADER.size
+            if os.path.getsize(file_path) > end:
+                self._recover_tail(end)
+        elif read_only:
+            raise FileNotFoundError(file_path)
+        else:
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(file_path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION))
+
+    def _add(self, conversation_id, offset, length, attrs):
+        position = len(self._ids)
+        self._ids.append(conversation_id)
+        self._offsets.append(offset)
+        self._lengths.append(length)
+        self._positions[conversation_id] = position
+        for name, value in attrs.items():
+            self._by_attr[name][value].append(position)
+
+    def _scan_tail(self, f, end):
+        """Целые записи после end: (запись, смещение, длина); оборванная завершает обход."""
+        f.seek(end)
+        while True:
+            header = f.read(LENGTH.size)
+            if len(header) < LENGTH.size:
+                return
+            (length,) = LENGTH.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            try:
+                record = json.loads(payload)
+            except ValueError:
+                return
+            yield record, end, length
+            end = f.tell()
+
+    def _recover_tail(self, end):
+        """
+        Индексирует записи хвоста без строк индекса. При чтении (read_only) только
+        в памяти; иначе дописывает их в индекс и отрезает оборванную запись.
+        """
+        if self.read_only:
+            with open(self.file_path, "rb") as f:
+                for record, offset, length in self._scan_tail(f, end):
+                    self._add(record["conversation_id"], offset, length, dialogue_attributes(record))
+            return
+        with open(self.file_path, "r+b") as f, JsonlWriter(index_path(self.file_path), "a") as index:
+            for record, offset, length in self._scan_tail(f, end):
+                attrs = dialogue_attributes(record)
+                index.write({"id": record["conversation_id"], "offset": offset, "length": length, "attrs": attrs})
+                self._add(record["conversation_id"], offset, length, attrs)
+                end = offset + LENGTH.size + length
+            f.truncate(end)
+        if index.count:
+            print(f"⚠️ {self.file_path}: відновлено {index.count} записів без індексу")
+
+    def append(self, record, person=None):
+        """
+        Добавляет диалог; повторный conversation_id пропускается, так что импорт
+        можно безопасно перезапускать. Возвращает True, если запись добавлена.
+        """
+        conversation_id = record["conversation_id"]
+        if self.read_only:
+            raise ValueError(f"Сховище {self.file_path} відкрито лише для читання")
+        if conversation_id in self._positions:
+            return False
+        if self._data is None:
+            self._data = open(self.file_path, "ab")
+            self._index = JsonlWriter(index_path(self.file_path), "a")
+
+        payload = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        offset = self._data.tell()
+        self._data.write(LENGTH.pack(len(payload)))
+        self._data.write(payload)
+        self._data.flush()
+
+        attrs = dialogue_attributes(record, person)
+        self._index.write({"id": conversation_id, "offset": offset, "length": len(payload), "attrs": attrs})
+        self._add(conversation_id, offset, len(payload), attrs)
+        return True
+
+    def _view(self, end):
+        """mmap файла данных; переоткрывается, если запись ушла за отображённый конец."""
+        if end > self._mapped_size:
+            if self._mm is not None:
+                try:
+                    self._mm.close()
+                except BufferError:
+                    # На отображение ссылается memoryview из raw(): держим его до close()
+                    self._retired_maps.append(self._mm)
+            with open(self.file_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = len(self._mm)
+        return self._mm
+
+    def raw(self, conversation_id):
+        """
+        JSON записи как memoryview над mmap, без копирования. Действителен до
+        close(); последующие append его не затрагивают.
+        """
+        position = self._positions.get(conversation_id)
+        if position is None:
+            return None
+        return self._raw_at(position)
+
+    def _raw_at(self, position):
+        start = self._offsets[position] + LENGTH.size
+        end = start + self._lengths[position]
+        return memoryview(self._view(end))[start:end]
+
+    def _record_at(self, position):
+        start = self._offsets[position] + LENGTH.size
+        end = start + self._lengths[position]
+        return json.loads(self._view(end)[start:end])
+
+    def get(self, conversation_id):
+        position = self._positions.get(conversation_id)
+        return None if position is None else self._record_at(position)
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self._positions
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        for position in range(len(self._ids)):
+            yield self._record_at(position)
+
+    def ids(self):
+        return list(self._ids)
+
+    def values(self, attribute):
+        """Значения атрибута и число диалогов с каждым из них."""
+        return {value: len(positions) for value, positions in self._by_attr[attribute].items()}
+
+    def find(self, **criteria):
+        """
+        Диалоги, у которых все атрибуты равны заданным, в порядке добавления,
+        например find(success=True, city="Київ"). Читаются только подходящие записи.
+        """
+        positions = None
+        for name, value in criteria.items():
+            matched = set(self._by_attr[name].get(value, ()))
+            positions = matched if positions is None else positions & matched
+            if not positions:
+                return
+        for position in sorted(positions or range(len(self._ids))):
+            yield self._record_at(position)
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+        for mm in self._retired_maps + [self._mm]:
+            if mm is None:
+                continue
+            try:
+                mm.close()
+            except BufferError:
+                # Ещё жив memoryview из raw(): отображение освободится вместе с ним
+                pass
+        self._retired_maps = []
+        self._mm = None
+        self._mapped_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def build_store(input_file=DIALOGUES_FILE, store_file=None, persons=None):
+    """
+    Дописывает в хранилище диалоги из JSONL, которых в нём ещё нет; атрибуты
+    персоны берутся по persons_file и person_id записи (persons — PersonaLookup).
+    """
+    store_file = store_file or store_path(input_file)
+    persons = persons or PersonaLookup()
+    added = 0
+    with DialogueStore(store_file) as store:
+        for record in iter_records(input_file):
+            added += store.append(record, persons.get(record))
+        total = len(store)
+    print(f"✅ Додано {added} діалогів у {store_file}, усього {total}")
+    return added
+
+
+def open_dialogues(input_file=DIALOGUES_FILE):
+    """
+    Потоковое чтение диалогов для refine/export: из хранилища этого файла, если
+    оно не старше input_file, иначе из самого файла.
+    """
+    store_file = store_path(input_file)
+    if (os.path.exists(store_file) and os.path.exists(index_path(store_file))
+            and (not os.path.exists(input_file)
+                 or os.path.getmtime(store_file) >= os.path.getmtime(input_file))):
+        # Только чтение: без восстановления хвоста, которое правит файлы хранилища
+        with DialogueStore(store_file, read_only=True) as store:
+            yield from store
+        return
+    yield from iter_records(input_file)
+
+
+if __name__ == "__main__":
+    build_store(sys.argv[1] if len(sys.argv) > 1 else DIALOGUES_FILE)
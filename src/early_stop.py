@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+
+from intents import Intent
+from generate_prompts import parse_interest
+
+# EARLY_STOP=1: диалоги без движения к записи обрываются раньше NUM_EXCHANGES
+EARLY_STOP = os.getenv("EARLY_STOP", "0") == "1"
+
+# Правила по уровню интереса персоны: (макс. уровень, макс. обменов в основном цикле,
+# сколько похожих подряд реплик клиента допустимо, сколько «пустых» реплик подряд)
+INTEREST_RULES = [
+    (2, 6, 1, 2),
+    (5, 10, 2, 3),
+    (9, 15, 2, 4),
+]
+# Реплики клиента с таким сходством по словам считаются повтором
+REPEAT_SIMILARITY = 0.7
+# Реплика без новых слов (доля новых ниже порога) и без интереса к цене/записи — топтание на месте
+STALL_NOVELTY = 0.3
+
+FINAL_MESSAGE = "Зрозуміло, дякую за ваш час! Якщо зміните думку, ми завжди на зв’язку. Гарного дня!"
+
+_WORD = re.compile(r"\w+")
+_PROGRESS = Intent.PRICE | Intent.SUCCESS
+
+
+def prompt_interest(prompt, person=None):
+    """Уровень интереса: из персоны, если она известна, иначе из строки «Рівень інтересу: …» промпта."""
+    if person and person.get("interest") is not None:
+        return person["interest"]
+    return parse_interest(prompt.get("text", ""))
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+class EarlyStopPolicy:
+    """Подключаемая политика: выдаёт трекер на каждый диалог; tracker() может вернуть None."""
+
+    def __init__(self, rules=INTEREST_RULES, repeat_similarity=REPEAT_SIMILARITY,
+                 stall_novelty=STALL_NOVELTY):
+        self.rules = sorted(rules)
+        self.repeat_similarity = repeat_similarity
+        self.stall_novelty = stall_novelty
+
+    def rule_for(self, interest):
+        if interest is None:
+            return self.rules[-1]
+        for rule in self.rules:
+            if interest <= rule[0]:
+                return rule
+        return self.rules[-1]
+
+    def tracker(self, prompt, max_exchanges, person=None):
+        _, budget, repeat_limit, stall_limit = self.rule_for(prompt_interest(prompt, person))
+        return EarlyStopTracker(self, min(budget, max_exchanges), repeat_limit, stall_limit, max_exchanges)
+
+
+class EarlyStopTracker:
+    """Состояние одного диалога: предыдущие реплики клиента и счётчики повторов и застоя."""
+
+    def __init__(self, policy, budget, repeat_limit, stall_limit, max_exchanges=None):
+        self.policy = policy
+        self.budget = budget
+        # Лимит по уровню интереса, совпадающий с длиной диалога, — не ранняя остановка
+        self.limits_length = max_exchanges is None or budget < max_exchanges
+        self.repeat_limit = repeat_limit
+        self.stall_limit = stall_limit
+        self.seen_words = set()
+        self.previous = None
+        self.repeats = 0
+        self.stalls = 0
+
+    def observe(self, step, client_reply, intents):
+        """
+        Вызывается после каждого завершённого обмена основного цикла (step с нуля).
+        Возвращает причину остановки или None.
+        """
+        words = _words(client_reply)
+        if self.previous is not None:
+            union = words | self.previous
+            similarity = len(words & self.previous) / len(union) if union else 1.0
+            self.repeats = self.repeats + 1 if similarity >= self.policy.repeat_similarity else 0
+        novelty = len(words - self.seen_words) / len(words) if words else 0.0
+        progress = bool(intents & _PROGRESS)
+        self.stalls = self.stalls + 1 if novelty < self.policy.stall_novelty and not progress else 0
+        self.previous = words
+        self.seen_words |= words
+
+        if self.repeats >= self.repeat_limit:
+            return "повтор реплік клієнта"
+        if self.stalls >= self.stall_limit:
+            return "розмова не просувається"
+        if self.limits_length and step + 1 >= self.budget:
+            return "вичерпано ліміт обмінів для цього рівня інтересу"
+        return None
+
+
+def savings(step, max_exchanges, usage):
+    """
+    Оценка сэкономленного: несостоявшиеся обмены (до max_exchanges) и токены
+    по среднему расходу на вызов в этом диалоге, по два вызова на обмен.
+    """
+    exchanges = max(0, max_exchanges - step - 1)
+    per_call = (usage["prompt_tokens"] + usage["completion_tokens"]) / usage["calls"] if usage["calls"] else 0
+    return {"exchanges_saved": exchanges, "tokens_saved_est": int(per_call * 2 * exchanges)}
+
+
+def new_savings():
+    return {"stopped": 0, "exchanges_saved": 0, "tokens_saved_est": 0}
+
+
+def add_savings(total, early_stop):
+    if early_stop:
+        total["stopped"] += 1
+        total["exchanges_saved"] += early_stop["exchanges_saved"]
+        total["tokens_saved_est"] += early_stop["tokens_saved_est"]
+
+
+def format_savings(total):
+    return (
+        f"зупинено рано {total['stopped']}, зекономлено обмінів {total['exchanges_saved']}, "
+        f"токенів ≈{total['tokens_saved_est']}"
+    )
+
+
+def default_policy():
+    return EarlyStopPolicy() if EARLY_STOP else None
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+
+import pandas as pd
+
+from dialogue_store import open_dialogues
+from persona_store import PersonaLookup, person_id_of
+from intents import Intent, classify
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+DIALOGUES_FILE = os.path.join(DATA_DIR, "dialogues.jsonl")
+LEGACY_DIALOGUES_FILE = os.path.join(DATA_DIR, "dialogues.json")
+
+# Parquet пишется через pyarrow (pip install pyarrow)
+PARQUET_COMPRESSION = "zstd"
+
+PERSONA_FIELDS = (
+    "name", "age", "gender", "city", "country", "profession", "hobbies", "character",
+    "values", "marital_status", "political_views", "interest", "tone", "mood"
+)
+
+# Повторяющиеся строки храним как category: в Parquet это словарное кодирование,
+# и при чтении столбец не превращается в миллионы отдельных Python-строк
+TURN_DTYPES = {
+    "conversation_id": "category",
+    "turn_idx": "int32",
+    "role": "category",
+    "message": "string",
+    "function_name": "category",
+    "function_args": "string",
+}
+SUMMARY_DTYPES = {
+    "conversation_id": "string",
+    "prompt_index": "Int32",
+    "person_id": "Int32",
+    "turns": "int32",
+    "success": "boolean",
+    "refusal_count": "Int16",
+    "refine_status": "category",
+    "llm_calls": "Int32",
+    "prompt_tokens": "Int64",
+    "completion_tokens": "Int64",
+    "age": "Int16",
+    "interest": "Int8",
+    "tone": "Int8",
+    "mood": "Int8",
+    "num_children": "Int8",
+}
+SUMMARY_DTYPES.update({
+    field: "category" for field in PERSONA_FIELDS if field not in SUMMARY_DTYPES
+})
+
+
+def table_paths(input_file):
+    """Пути таблиц для файла диалогов: dialogues.jsonl → dialogues_turns/dialogues_summary.parquet."""
+    stem = os.path.basename(input_file).split(".")[0]
+    return (
+        os.path.join(DATA_DIR, f"{stem}_turns.parquet"),
+        os.path.join(DATA_DIR, f"{stem}_summary.parquet"),
+    )
+
+
+def parse_function_call(message):
+    """(имя функции, аргументы в JSON) для реплики-вызова или (None, None)."""
+    text = message.lstrip()
+    if not text.startswith("{"):
+        return None, None
+    try:
+        call = json.loads(text).get("function_call")
+    except (json.JSONDecodeError, AttributeError):
+        return None, None
+    if not isinstance(call, dict):
+        return None, None
+    args = call.get("arguments")
+    if args is not None and not isinstance(args, str):
+        args = json.dumps(args, ensure_ascii=False, sort_keys=True)
+    return call.get("name"), args
+
+
+def build_tables(records, persons=None):
+    """
+    Разворачивает диалоги в столбцы двух таблиц: реплики и по строке на диалог.
+    Для записей без success/refusal_count (старые файлы, refined-диалоги) они
+    выводятся из реплик: вызов sign_for_promo и реплики клиента с отказом.
+    persons — PersonaLookup, поля персоны берутся по persons_file и person_id диалога.
+    """
+    turns = {column: [] for column in TURN_DTYPES}
+    summary = {column: [] for column in SUMMARY_DTYPES}
+
+    for i, record in enumerate(records):
+        conversation_id = record.get("conversation_id", f"dialogue_{i}")
+        signed_up = False
+        refusals = 0
+        dialogue = record.get("dialogue") or []
+        for turn_idx, turn in enumerate(dialogue):
+            message = turn.get("message") or ""
+            function_name, function_args = parse_function_call(message)
+            turns["conversation_id"].append(conversation_id)
+            turns["turn_idx"].append(turn_idx)
+            turns["role"].append(turn.get("role"))
+            turns["message"].append(message)
+            turns["function_name"].append(function_name)
+            turns["function_args"].append(function_args)
+            if function_name == "sign_for_promo":
+                signed_up = True
+            elif turn.get("role") == "client" and classify(message) & Intent.REFUSAL:
+                refusals += 1
+
+        prompt_index = record.get("prompt_index")
+        person_id = person_id_of(record)
+        person = (persons.get(record) if persons is not None else None) or {}
+        usage = record.get("usage") or {}
+        summary["conversation_id"].append(conversation_id)
+        summary["prompt_index"].append(prompt_index)
+        summary["person_id"].append(person_id)
+        summary["turns"].append(len(dialogue))
+        summary["success"].append(record.get("success", signed_up))
+        summary["refusal_count"].append(record.get("refusal_count", refusals))
+        summary["refine_status"].append(record.get("refine_status"))
+        summary["llm_calls"].append(usage.get("calls"))
+        summary["prompt_tokens"].append(usage.get("prompt_tokens"))
+        summary["completion_tokens"].append(usage.get("completion_tokens"))
+        for field in PERSONA_FIELDS:
+            summary[field].append(person.get(field))
+        summary["num_children"].append(len(person["children"]) if "children" in person else None)
+
+    return _frame(turns, TURN_DTYPES), _frame(summary, SUMMARY_DTYPES)
+
+
+def _series(values, dtype):
+    # Категории строятся из string, чтобы пустой столбец не стал float
+    if dtype == "category":
+        return pd.Series(values, dtype="string").astype("category")
+    return pd.Series(values, dtype=dtype)
+
+
+def _frame(columns, dtypes):
+    return pd.DataFrame({name: _series(values, dtypes[name]) for name, values in columns.items()})
+
+
+def export_dialogues(input_file=DIALOGUES_FILE, persons=None):
+    """Пишет таблицы реплик и диалогов в Parquet; возвращает их пути."""
+    if not os.path.exists(input_file) and input_file == DIALOGUES_FILE:
+        input_file = LEGACY_DIALOGUES_FILE
+    if not os.path.exists(input_file):
+        print(f"❌ Файл {input_file} не знайдено!")
+        return None
+
+    turns, summary = build_tables(open_dialogues(input_file), persons or PersonaLookup())
+    turns_file, summary_file = table_paths(input_file)
+    turns.to_parquet(turns_file, engine="pyarrow", compression=PARQUET_COMPRESSION, index=False)
+    summary.to_parquet(summary_file, engine="pyarrow", compression=PARQUET_COMPRESSION, index=False)
+    print(f"✅ {len(summary)} діалогів, {len(turns)} реплік: {turns_file}, {summary_file}")
+    return turns_file, summary_file
+
+
+def load_turns(input_file=DIALOGUES_FILE, columns=None):
+    """
+    Таблица реплик для ноутбуков. Строки остаются в памяти Arrow (без Python-объектов
+    на каждую реплику), поэтому миллионы реплик читаются за доли секунды;
+    columns ограничивает чтение нужными столбцами.
+    """
+    return pd.read_parquet(table_paths(input_file)[0], columns=columns, dtype_backend="pyarrow")
+
+
+def load_dialogue_table(input_file=DIALOGUES_FILE, columns=None):
+    return pd.read_parquet(table_paths(input_file)[1], columns=columns, dtype_backend="pyarrow")
+
+
+if __name__ == "__main__":
+    export_dialogues(sys.argv[1] if len(sys.argv) > 1 else DIALOGUES_FILE)
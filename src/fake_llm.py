@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Настройки по умолчанию для LLM_BACKEND=fake и для локального сервера
+FAKE_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))          # секунды на вызов
+FAKE_LATENCY_JITTER = float(os.getenv("FAKE_LLM_LATENCY_JITTER", "0"))
+FAKE_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))     # доля 429/503
+FAKE_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+# Доля обрезанных JSON-ответов refine_dialogues — чтобы проверить повторный запрос с исправлением
+FAKE_INVALID_JSON_RATE = float(os.getenv("FAKE_LLM_INVALID_JSON_RATE", "0"))
+DEFAULT_PORT = 8089
+
+CLIENT_OPENERS = [
+    "Слухаю.",
+    "Що саме?",
+    "Скільки коштує?",
+    "Не цікаво.",
+    "Так, хочу спробувати.",
+    "А для якого віку це?",
+    "Ні, дякую.",
+    "Я зайнятий, кажіть швидко.",
+]
+
+CLIENT_REPLIES = [
+    "А чим це корисно дитині?",
+    "Скільки коштує?",
+    "Не маю часу на це.",
+    "Мені не потрібно, дякую.",
+    "Хочу спробувати пробний урок.",
+    "Звучить цікаво, розкажіть більше.",
+    "Я подумаю.",
+    "Добре, до побачення.",
+]
+
+SLOT_ANSWERS = {
+    "місто": ["Київ", "Я з Дніпра.", "Львів"],
+    "звати": ["Оля", "Сина звати Петрик.", "Марічка"],
+    "телефон": ["0501234567", "Мій номер 0671112233."],
+}
+
+BOT_REPLIES = [
+    "Наші заняття розвивають увагу та пам'ять дитини. Чи є у вас діти віком 5–12 років?",
+    "Ментальна арифметика допомагає дитині швидше рахувати та краще вчитися. Бажаєте спробувати безкоштовний урок?",
+    "Розумію вас. Перший урок безкоштовний — ви нічим не ризикуєте. Спробуєте?",
+    "Заняття проходять двічі на тиждень, онлайн або офлайн. Що вам зручніше?",
+]
+
+
+class FakeLLMError(Exception):
+    """Имитация 429/503 от API: gpt_client повторяет её так же, как настоящую."""
+
+    def __init__(self, message, http_status=429, retry_after=None):
+        super().__init__(message)
+        self.http_status = http_status
+        self.headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+
+
+def _response(message, usage_prompt, usage_completion):
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "model": "fake",
+        "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": usage_prompt,
+            "completion_tokens": usage_completion,
+            "total_tokens": usage_prompt + usage_completion
+        }
+    }
+
+
+def _function_call(name, arguments):
+    return {
+        "role": "assistant",
+        "content": None,
+        "function_call": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}
+    }
+
+
+class FakeChatCompletion:
+    """
+    Детерминированная замена openai.ChatCompletion: ответ зависит только от seed
+    и содержимого messages, поэтому прогоны воспроизводимы при любом параллелизме.
+    Задержка и доля ошибок настраиваются; ошибки не влияют на итоговый ответ.
+    """
+
+    def __init__(self, seed=FAKE_SEED, latency=FAKE_LATENCY,
+                 latency_jitter=FAKE_LATENCY_JITTER, error_rate=FAKE_ERROR_RATE):
+        self.seed = seed
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self._error_rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _rng(self, messages):
+        digest = hashlib.sha256(
+            f"{self.seed}:{json.dumps(messages, ensure_ascii=False, sort_keys=True)}".encode("utf-8")
+        ).digest()
+        return random.Random(digest)
+
+    def create(self, **kwargs):
+        messages = kwargs.get("messages", [])
+        with self._lock:
+            self.calls += 1
+            fail = self._error_rng.random() < self.error_rate
+            status = self._error_rng.choice([429, 503])
+            jitter = self._error_rng.uniform(0, self.latency_jitter)
+
+        if self.latency or jitter:
+            time.sleep(self.latency + jitter)
+        if fail:
+            raise FakeLLMError("fake overload", http_status=status)
+
+        rng = self._rng(messages)
+        prompt_tokens = len(json.dumps(messages, ensure_ascii=False)) // 3
+        if kwargs.get("functions"):
+            message = self._bot_message(messages, rng)
+        else:
+            message = {"role": "assistant", "content": self._text_reply(messages, rng)}
+        completion = message.get("content") or json.dumps(message.get("function_call"), ensure_ascii=False)
+        return _response(message, prompt_tokens, len(completion) // 3 + 1)
+
+    def _bot_message(self, messages, rng):
+        last = messages[-1]["content"].lower() if messages else ""
+        turns = sum(1 for m in messages if m["role"] == "assistant")
+
+        if "коштує" in last or "ціна" in last:
+            return _function_call("get_price", {"city": "Kyiv", "online": rng.random() < 0.5})
+        if any(kw in last for kw in ("не цікаво", "не потрібно", "ні, дякую", "не маю часу")):
+            if rng.random() < 0.5:
+                return _function_call("stop_dialogue", {"reason": "клієнт відмовився"})
+        if turns >= 6 and rng.random() < 0.3:
+            return _function_call("sign_for_promo", {
+                "city": "Kyiv", "child_name": "Оля", "phone": "0501234567"
+            })
+        if turns >= 10 and rng.random() < 0.3:
+            return {"role": "assistant", "content": "Дякую за розмову, до побачення!"}
+        return {"role": "assistant", "content": rng.choice(BOT_REPLIES)}
+
+    def _text_reply(self, messages, rng):
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        last = messages[-1]["content"] if messages else ""
+
+        # generate_cities: пачка городов в JSON
+        if "варианта названия" in system and last.startswith("["):
+            names = json.loads(last)
+            return json.dumps({"cities": {n: [n] * 4 for n in names}}, ensure_ascii=False)
+
+        # generate_cities: четыре варианта названия одного города
+        if "варианта названия города" in system:
+            name = system.split("города")[-1].split(":")[0].strip() or "Київ"
+            return "\n".join(f"{i}) {name}" for i in range(1, 5))
+
+        # Клиент в generate_dialogues: system начинается с описания персоны
+        if system.startswith("Ти — звичайний клієнт"):
+            low = last.lower()
+            for marker, answers in SLOT_ANSWERS.items():
+                if marker in low:
+                    return rng.choice(answers)
+            if len(messages) <= 2:
+                return rng.choice(CLIENT_OPENERS)
+            return rng.choice(CLIENT_REPLIES)
+
+        # refine_dialogues в JSON-режиме: исходный диалог в обёртке {"dialogue": [...]}
+        if '{"dialogue"' in system:
+            source = next(m["content"] for m in messages if m["role"] == "user")
+            if len(messages) == 2 and rng.random() < FAKE_INVALID_JSON_RATE:
+                return source[:len(source) // 2]
+            return json.dumps({"dialogue": json.loads(source)}, ensure_ascii=False)
+
+        # refine-стадии: возвращаем вход без изменений
+        return last
+
+
+class _Handler(BaseHTTPRequestHandler):
+    backend = None
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        try:
+            status, headers, body = 200, {}, self.backend.create(**request)
+        except FakeLLMError as e:
+            status = e.http_status
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            body = {"error": {"message": str(e), "type": "server_error", "code": status}}
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=DEFAULT_PORT, backend=None):
+    """
+    Локальный HTTP-сервер с API /v1/chat/completions.
+    Для использования: OPENAI_API_BASE=http://127.0.0.1:<port>/v1
+    """
+    _Handler.backend = backend or FakeChatCompletion()
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    print(f"🧪 Фейковий LLM-сервер слухає http://127.0.0.1:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    port = DEFAULT_PORT
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[1])
+        except ValueError:
+            print(f"Невірний порт, використовується {DEFAULT_PORT}")
+    serve(port)
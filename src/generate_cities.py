@@ -1,19 +1,33 @@
 import os
+import sys
 import json
-from dotenv import load_dotenv
-import openai
 
-# Загружаем API-ключ
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# API-ключ, лимиты запросов и повторы — в gpt_client
+from gpt_client import chat_completion
+from response_cache import report_cache_stats
+from metrics import export_metrics
+from parallel import ordered_imap
+from batch_mode import batch_enabled, run_batch, response_text
 
-# Пути к файлам
-input_file = "data/ua.json"
-output_file = "data/cities_output.json"
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+INPUT_FILE = os.path.join(DATA_DIR, "ua.json")
+OUTPUT_FILE = os.path.join(DATA_DIR, "cities_output.json")
 
-# Читаем входной JSON
-with open(input_file, "r", encoding="utf-8") as f:
-    cities_data = json.load(f)
+# Ограничиваем обработку 1000 городами
+MAX_CITIES = 1000
+# Сколько городов упаковывается в один запрос и сколько запросов идёт параллельно
+CITIES_PER_REQUEST = 25
+MAX_WORKERS = int(os.getenv("CITIES_WORKERS", "4"))
+
+NUM_VARIANTS = 4
+
+BATCH_SYSTEM_PROMPT = (
+    "Для каждого города из списка сгенерируй четыре варианта названия: "
+    "1) русский, 2) украинский, 3) на суржике, 4) с ошибкой. "
+    "Ответь только JSON-объектом вида "
+    '{"cities": {"<название из списка>": ["русский", "украинский", "суржик", "с ошибкой"]}} '
+    "с ключами ровно как в списке."
+)
 
 # Функция для безопасного получения численности населения
 def safe_int(value):
@@ -22,49 +36,181 @@ def safe_int(value):
     except ValueError:
         return 0
 
-# Считаем общее население (фильтруем города без данных о населении)
-total_population = sum(safe_int(city.get("population", "0")) for city in cities_data)
+def load_json(file_path, default):
+    if not os.path.exists(file_path):
+        return default
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f) or default
 
-# Функция для генерации вариантов названий города
-def generate_city_variants(city_name):
+def city_variants_request(city_name):
     prompt = f"Генерируй четыре варианта названия города {city_name}: 1) русский, 2) украинский, 3) на суржике, 4) с ошибкой."
-    response = openai.ChatCompletion.create(
-        model="gpt-4o",
-        messages=[{"role": "system", "content": prompt}],
-        max_tokens=50
-    )
-    return response["choices"][0]["message"]["content"].strip().split("\n")
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "system", "content": prompt}],
+        "max_tokens": 50
+    }
+
+def city_batch_request(city_names):
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": json.dumps(city_names, ensure_ascii=False)}
+        ],
+        "max_tokens": 40 * len(city_names) + 50,
+        "response_format": {"type": "json_object"}
+    }
 
-# Ограничиваем обработку 50 городами
-cities_data = cities_data[:1000]
+# Функция для генерации вариантов названий одного города (запасной путь)
+def generate_city_variants(city_name):
+    response = chat_completion(stage="cities", **city_variants_request(city_name))
+    return response_text(response).split("\n")
 
-# Обрабатываем данные по городам
-cities_output = {}
+def validate_variants(variants):
+    """Список из NUM_VARIANTS непустых строк либо None."""
+    if not isinstance(variants, list) or len(variants) < NUM_VARIANTS:
+        return None
+    if not all(isinstance(v, str) and v.strip() for v in variants[:NUM_VARIANTS]):
+        return None
+    return [v.strip() for v in variants[:NUM_VARIANTS]]
 
-for city in cities_data:
-    city_name = city["city"]
-    population = safe_int(city.get("population", "0"))
-    probability = round(population / total_population, 6) if total_population > 0 else 0
+def parse_batch_response(content, city_names):
+    """Разбирает JSON-ответ пакета; возвращает {город: варианты} только для валидных городов."""
+    try:
+        data = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    cities = data.get("cities") if isinstance(data, dict) else None
+    if not isinstance(cities, dict):
+        return {}
+    result = {}
+    for name in city_names:
+        variants = validate_variants(cities.get(name))
+        if variants:
+            result[name] = variants
+    return result
 
+def generate_city_variants_batch(city_names):
+    """
+    Один запрос на пачку городов со структурированным JSON-ответом.
+    Города, для которых ответ невалиден, добираются по одному; при ошибке
+    дублируется исходное название, как и раньше.
+    """
+    result = {}
     try:
-        city_variants = generate_city_variants(city_name)
-        if len(city_variants) < 4:
-            raise ValueError("Недостаточно вариантов названий города")
+        response = chat_completion(stage="cities", **city_batch_request(city_names))
+        result = parse_batch_response(response_text(response), city_names)
     except Exception as e:
-        print(f"Ошибка генерации для {city_name}: {e}")
-        city_variants = [city_name] * 4  # Если ошибка, дублируем оригинальное имя
+        print(f"Ошибка генерации пачки из {len(city_names)} городов: {e}")
 
-    cities_output[city_name] = {
-        "country": "Ukraine",
-        "city": city_variants,
-        "probability": probability
-    }
+    for city_name in city_names:
+        if city_name in result:
+            continue
+        try:
+            city_variants = generate_city_variants(city_name)
+            if len(city_variants) < NUM_VARIANTS:
+                raise ValueError("Недостаточно вариантов названий города")
+        except Exception as e:
+            print(f"Ошибка генерации для {city_name}: {e}")
+            city_variants = [city_name] * NUM_VARIANTS  # Если ошибка, дублируем оригинальное имя
+        result[city_name] = city_variants
+    return result
+
+def generate_cities_in_batch(city_names):
+    """
+    Пакетный режим: пачки по CITIES_PER_REQUEST городов одним файлом Batch API,
+    затем вторым файлом — по одному запросу на каждый город, для которого ответ невалиден.
+    """
+    chunks = [city_names[i:i + CITIES_PER_REQUEST] for i in range(0, len(city_names), CITIES_PER_REQUEST)]
+    responses = run_batch("cities", [(f"cities-{n}", city_batch_request(chunk)) for n, chunk in enumerate(chunks)])
+    result = {}
+    for n, chunk in enumerate(chunks):
+        response = responses.get(f"cities-{n}")
+        if response:
+            result.update(parse_batch_response(response_text(response), chunk))
+
+    missing = [name for name in city_names if name not in result]
+    responses = run_batch(
+        "cities",
+        [(f"city-{k}", city_variants_request(name)) for k, name in enumerate(missing)],
+        name="cities_single"
+    )
+    for k, city_name in enumerate(missing):
+        response = responses.get(f"city-{k}")
+        city_variants = response_text(response).split("\n") if response else []
+        if len(city_variants) < NUM_VARIANTS:
+            print(f"Ошибка генерации для {city_name}: недостаточно вариантов названий города")
+            city_variants = [city_name] * NUM_VARIANTS
+        result[city_name] = city_variants
+    return result
+
+def build_cities_output(existing, cities_data, generated, total_population):
+    cities_output = dict(existing)
+    for city in cities_data:
+        city_name = city["city"]
+        if city_name not in generated:
+            continue
+        population = safe_int(city.get("population", "0"))
+        probability = round(population / total_population, 6) if total_population > 0 else 0
+        cities_output[city_name] = {
+            "country": "Ukraine",
+            "city": generated[city_name],
+            "probability": probability
+        }
+    return cities_output
+
+def save_cities(cities_output):
+    tmp_file = OUTPUT_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(cities_output, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, OUTPUT_FILE)
+
+def generate_cities(max_cities=MAX_CITIES, max_workers=MAX_WORKERS):
+    cities_data = load_json(INPUT_FILE, [])
+    if not cities_data:
+        print(f"❌ Файл {INPUT_FILE} не знайдено або порожній!")
+        return {}
+
+    # Считаем общее население (фильтруем города без данных о населении)
+    total_population = sum(safe_int(city.get("population", "0")) for city in cities_data)
+    cities_data = cities_data[:max_cities]
+
+    # Уже обработанные города из прошлых запусков не запрашиваем повторно
+    existing = load_json(OUTPUT_FILE, {})
+    todo = [city["city"] for city in cities_data if city["city"] not in existing]
+    print(f"Міст усього: {len(cities_data)}, вже готово: {len(cities_data) - len(todo)}, до обробки: {len(todo)}")
+
+    if batch_enabled():
+        generated = generate_cities_in_batch(todo)
+        save_cities(build_cities_output(existing, cities_data, generated, total_population))
+    else:
+        batches = [todo[i:i + CITIES_PER_REQUEST] for i in range(0, len(todo), CITIES_PER_REQUEST)]
+        generated = {}
+        for done, variants in enumerate(ordered_imap(generate_city_variants_batch, batches, max_workers), 1):
+            generated.update(variants)
+            print(f"➡ Пачка {done}/{len(batches)} готова")
+
+            # Сохраняем после каждой пачки, чтобы прерванный запуск можно было продолжить
+            save_cities(build_cities_output(existing, cities_data, generated, total_population))
+
+    report_cache_stats("cities")
+    export_metrics()
+    return load_json(OUTPUT_FILE, {})
+
+def main():
+    max_cities = MAX_CITIES
+    if len(sys.argv) > 1:
+        try:
+            max_cities = int(sys.argv[1])
+        except ValueError:
+            print(f"Невірний аргумент, використовується значення за замовчуванням: {MAX_CITIES}")
+
+    cities_output = generate_cities(max_cities)
 
-# Сохраняем результат
-with open(output_file, "w", encoding="utf-8") as f:
-    json.dump(cities_output, f, ensure_ascii=False, indent=4)
+    # Выводим 3 примера
+    sample_keys = list(cities_output.keys())[:3]
+    for key in sample_keys:
+        print(f"{key}: {cities_output[key]}")
 
-# Выводим 3 примера
-sample_keys = list(cities_output.keys())[:3]
-for key in sample_keys:
-    print(f"{key}: {cities_output[key]}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
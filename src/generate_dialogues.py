@@ -1,49 +1,54 @@
 import os
 import json
 import uuid
-import openai
+import itertools
 import random
-import re
-
-from dotenv import load_dotenv
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+import sys
 
+from gpt_client import chat_completion
 from dialogue_functions import (
     stop_dialogue_schema,
     get_price_schema,
     sign_for_promo_schema,
     handle_ai_function_call,
     stop_dialogue,
+    DialogueState,
     generate_get_price_json,
     generate_stop_dialogue_json,
     generate_sign_for_promo_json
 )
+from parallel import ordered_imap
+from context_window import build_messages, new_usage, record_usage, add_usage, format_usage
+from intents import (
+    Intent,
+    classify,
+    SUCCESS_KEYWORDS,
+    GOODBYE_KEYWORDS,
+    REFUSAL_KEYWORDS
+)
+from jsonl_io import JsonlWriter
+from run_manifest import RunManifest, item_id, split_pending, finish_stage
+from response_cache import report_cache_stats
+from metrics import export_metrics
+from seeding import conversation_uuid, get_run_seed, set_run_seed
+from early_stop import default_policy, savings, new_savings, add_savings, format_savings, FINAL_MESSAGE
+from slot_responder import slot_responder, SLOT_RESPONDER
+from persona_store import load_persona_store, persons_path
+from generate_prompts import PERSONS_FILE
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
 PROMPTS_FILE = os.path.join(DATA_DIR, "prompts.json")
-DIALOGUES_FILE = os.path.join(DATA_DIR, "dialogues.json")
+# Суффикс .jsonl.gz включает сжатие
+DIALOGUES_FILE = os.path.join(DATA_DIR, "dialogues.jsonl")
 BOT_PROMPT_FILE = os.path.join(DATA_DIR, "bot_prompt.txt")
 
 NUM_EXCHANGES = 15
 
-SUCCESS_KEYWORDS = [
-    "запишіть", "як записатися", "як можна записатися", "пробний урок",
-    "хочу спробувати", "давайте спробуємо", "я згоден", "я згідна",
-    "так, хочу", "так, згоден", "так, згодна"
-]
-
-GOODBYE_KEYWORDS = [
-    r"\bдо\s+побачення\b",
-    r"\bдо\s+зустрічі\b",
-    r"\bпрощавай\b",
-    r"\bбувай\b"
-]
+# Сколько диалогов генерируется одновременно (переопределяется DIALOGUE_WORKERS)
+MAX_WORKERS = int(os.getenv("DIALOGUE_WORKERS", "8"))
 
-REFUSAL_KEYWORDS = [
-    "не цікаво", "не потрібно", "відмовляюся", "не маю часу",
-    "не планую", "не зацікавлена", "не підходить", "ні, дякую"
-]
+# Политика ранней остановки по умолчанию (без EARLY_STOP=1 — None, диалоги идут до NUM_EXCHANGES)
+EARLY_STOP_POLICY = default_policy()
 
 def format_function_call(name, arguments):
     return json.dumps({
@@ -54,22 +59,16 @@ def format_function_call(name, arguments):
     }, ensure_ascii=False, indent=4)
 
 def is_goodbye(text: str) -> bool:
-    txt_lower = text.lower()
-    for pattern in GOODBYE_KEYWORDS:
-        if re.search(pattern, txt_lower):
-            return True
-    return False
+    return Intent.GOODBYE in classify(text)
 
 def is_price_inquiry(text: str) -> bool:
-    return "скільки коштує" in text.lower()
+    return Intent.PRICE in classify(text)
 
 def is_refusal(text: str) -> bool:
-    low = text.lower()
-    return any(kw in low for kw in REFUSAL_KEYWORDS)
+    return Intent.REFUSAL in classify(text)
 
 def check_success(text: str) -> bool:
-    text = text.lower()
-    return any(kw in text for kw in SUCCESS_KEYWORDS)
+    return Intent.SUCCESS in classify(text)
 
 def load_file(file_path):
     if not os.path.exists(file_path):
@@ -88,42 +87,41 @@ def load_prompts(file_path):
         print("❌ Файл промптів порожній!")
     return data
 
-def generate_bot_response(bot_context, retry_count=0):
+def generate_bot_response(bot_context, usage=None):
     try:
-        response = openai.ChatCompletion.create(
+        response = chat_completion(
+            stage="dialogues",
             model="gpt-4o",
-            messages=bot_context,
+            messages=build_messages(bot_context),
             max_tokens=400,
             temperature=0.7,
             functions=[stop_dialogue_schema, get_price_schema, sign_for_promo_schema],
             function_call="auto"
         )
+        if usage is not None:
+            record_usage(usage, response)
         return response
     except Exception as e:
-        if retry_count < 1:
-            return generate_bot_response(bot_context, retry_count=retry_count+1)
         print(f"❌ Помилка генерації відповіді бота: {e}")
         return None
 
-def generate_client_response(client_context, retry_count=0):
+def generate_client_response(client_context, usage=None):
     try:
-        response = openai.ChatCompletion.create(
+        response = chat_completion(
+            stage="dialogues",
             model="gpt-4o",
-            messages=client_context,
+            messages=build_messages(client_context),
             max_tokens=300,
             temperature=0.7
         )
+        if usage is not None:
+            record_usage(usage, response)
         return response
     except Exception as e:
-        if retry_count < 1:
-            return generate_client_response(client_context, retry_count=retry_count+1)
         print(f"❌ Помилка генерації відповіді клієнта: {e}")
         return None
 
-previous_get_price_params = None
-
-def extract_bot_message_or_stop(response):
-    global previous_get_price_params
+def extract_bot_message_or_stop(response, state):
     if not response or "choices" not in response:
         return None, False
 
@@ -136,16 +134,16 @@ def extract_bot_message_or_stop(response):
         args_str = func_call.get("arguments") or "{}"
         args = json.loads(args_str)
 
-        stop_called = handle_ai_function_call(choice)
+        stop_called = handle_ai_function_call(choice, state)
 
         if name == "get_price":
             city = args.get("city", "Dnipro")
             online = args.get("online", False)
             current_params = (city, online)
-            if previous_get_price_params == current_params:
+            if state.previous_get_price_params == current_params:
                 bot_msg = "Ціна уточнюється, я повідомлю, коли вона буде відома. А поки спробуєте безкоштовний урок?"
                 return bot_msg, stop_called
-            previous_get_price_params = current_params
+            state.previous_get_price_params = current_params
             arguments = {"city": city, "online": online}
             bot_msg = format_function_call("get_price", arguments)
             return bot_msg, stop_called
@@ -175,270 +173,284 @@ def extract_client_message(response):
     choice = response["choices"][0]
     return choice["message"].get("content", "").strip()
 
-def create_dialogue(prompt, bot_prompt):
-    conversation_id = str(uuid.uuid4())
-    dialogue = {"conversation_id": conversation_id, "dialogue": []}
-    success = False
-    refusal_count = 0
-    dialogue_ended = False
-    sign_up_params = {"city": None, "child_name": None, "phone": None}
-
-    bot_context = [{"role": "system", "content": bot_prompt}]
-    client_system = f"Ти — звичайний клієнт. Ось твій опис: {prompt['text']}"
-    client_context = [{"role": "system", "content": client_system}]
-
-    greet = "Вітаю! Я – Штучний інтелект школи усного рахунку «Соробан». Чи є у вас хвилинка поспілкуватися?"
-    bot_context.append({"role": "assistant", "content": greet})
-    dialogue["dialogue"].append({"role": "sales_bot", "message": greet})
-
-    client_context.append({"role": "user", "content": greet})
-    resp_client = generate_client_response(client_context)
-    if not resp_client:
-        return dialogue, success
-
-    client_msg = extract_client_message(resp_client) or ""
-    dialogue["dialogue"].append({"role": "client", "message": client_msg})
-
-    if is_price_inquiry(client_msg):
-        bot_msg = "В якому місті ви проживаєте? І вам зручніше онлайн чи офлайн?"
-        dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-        bot_context.append({"role": "assistant", "content": bot_msg})
-        client_context.append({"role": "user", "content": bot_msg})
-
-        resp_client = generate_client_response(client_context)
-        if resp_client:
-            client_reply = extract_client_message(resp_client) or ""
-            dialogue["dialogue"].append({"role": "client", "message": client_reply})
-            client_context.append({"role": "assistant", "content": client_reply})
-            bot_context.append({"role": "user", "content": client_reply})
-
-    client_context.append({"role": "assistant", "content": client_msg})
-    bot_context.append({"role": "user", "content": client_msg})
-
-    if is_goodbye(client_msg):
-        final_bot = "Дякую, успіхів і до побачення!"
-        dialogue["dialogue"].append({"role": "sales_bot", "message": final_bot})
-        stop_dialogue("клієнт одразу сказав «до побачення»")
-        dialogue_ended = True
-        return dialogue, success
-
-    if check_success(client_msg):
-        success = True
-        bot_msg = "Назвіть, будь ласка, місто, в якому ви живете."
-        dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-        bot_context.append({"role": "assistant", "content": bot_msg})
-        client_context.append({"role": "user", "content": bot_msg})
-
-        resp_client = generate_client_response(client_context)
-        if resp_client:
-            client_reply = extract_client_message(resp_client) or ""
-            dialogue["dialogue"].append({"role": "client", "message": client_reply})
-            sign_up_params["city"] = client_reply
-            client_context.append({"role": "assistant", "content": client_reply})
-            bot_context.append({"role": "user", "content": client_reply})
-
-            bot_msg = "Як звати вашу дитину?"
-            dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-            bot_context.append({"role": "assistant", "content": bot_msg})
-            client_context.append({"role": "user", "content": bot_msg})
-
-            resp_client = generate_client_response(client_context)
-            if resp_client:
-                client_reply = extract_client_message(resp_client) or ""
-                dialogue["dialogue"].append({"role": "client", "message": client_reply})
-                sign_up_params["child_name"] = client_reply
-                client_context.append({"role": "assistant", "content": client_reply})
-                bot_context.append({"role": "user", "content": client_reply})
-
-                bot_msg = "На який номер телефону зручно отримати підтвердження?"
-                dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-                bot_context.append({"role": "assistant", "content": bot_msg})
-                client_context.append({"role": "user", "content": bot_msg})
-
-                resp_client = generate_client_response(client_context)
-                if resp_client:
-                    client_reply = extract_client_message(resp_client) or ""
-                    dialogue["dialogue"].append({"role": "client", "message": client_reply})
-                    sign_up_params["phone"] = client_reply
-                    client_context.append({"role": "assistant", "content": client_reply})
-                    bot_context.append({"role": "user", "content": client_reply})
-
-                    arguments = {
-                        "city": sign_up_params["city"] or "Dnipro",
-                        "child_name": sign_up_params["child_name"] or "Нонейм",
-                        "phone": sign_up_params["phone"] or "12345678"
-                    }
-                    final_bot = format_function_call("sign_for_promo", arguments)
-                    dialogue["dialogue"].append({"role": "sales_bot", "message": final_bot})
-                    handle_ai_function_call({
-                        "message": {
-                            "function_call": {
-                                "name": "sign_for_promo",
-                                "arguments": json.dumps({
-                                    "city": sign_up_params["city"] or "Dnipro",
-                                    "child_name": sign_up_params["child_name"] or "Нонейм",
-                                    "phone": sign_up_params["phone"] or "12345678"
-                                })
-                            }
-                        }
-                    })
-                    stop_dialogue("успіх з першої ж репліки")
-                    dialogue_ended = True
-                    return dialogue, success
-    else:
-        if is_refusal(client_msg):
-            refusal_count += 1
-
-    for step in range(NUM_EXCHANGES):
-        if dialogue_ended:
-            break
-
-        resp_bot = generate_bot_response(bot_context)
-        if not resp_bot:
-            break
-
-        bot_msg, stop_called = extract_bot_message_or_stop(resp_bot)
-        if bot_msg is None:
-            break
-
-        if bot_msg.strip() != "":
-            dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-
-        if stop_called:
-            dialogue_ended = True
-            break
-
-        if is_goodbye(bot_msg):
-            stop_dialogue("бот сказав до побачення")
-            dialogue_ended = True
-            break
-
-        bot_context.append({"role": "assistant", "content": bot_msg})
-        client_context.append({"role": "user", "content": bot_msg})
-
-        resp_client = generate_client_response(client_context)
-        if not resp_client:
-            break
-
-        client_reply = extract_client_message(resp_client) or ""
-        dialogue["dialogue"].append({"role": "client", "message": client_reply})
-
-        if is_price_inquiry(client_reply):
-            bot_msg = "В якому місті ви проживаєте? І вам зручніше онлайн чи офлайн?"
-            dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-            bot_context.append({"role": "assistant", "content": bot_msg})
-            client_context.append({"role": "user", "content": bot_msg})
-
-            resp_client = generate_client_response(client_context)
-            if resp_client:
-                client_reply = extract_client_message(resp_client) or ""
-                dialogue["dialogue"].append({"role": "client", "message": client_reply})
-                client_context.append({"role": "assistant", "content": client_reply})
-                bot_context.append({"role": "user", "content": client_reply})
-
-        client_context.append({"role": "assistant", "content": client_reply})
-        bot_context.append({"role": "user", "content": client_reply})
-
-        if is_goodbye(client_reply):
-            final_bot = "Дякую, успіхів і до побачення!"
-            dialogue["dialogue"].append({"role": "sales_bot", "message": final_bot})
-            stop_dialogue("клієнт сказав до побачення")
-            dialogue_ended = True
-            break
-
-        if check_success(client_reply):
-            success = True
-            if not sign_up_params["city"]:
-                bot_msg = "Назвіть, будь ласка, місто, в якому ви живете."
-                dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-                bot_context.append({"role": "assistant", "content": bot_msg})
-                client_context.append({"role": "user", "content": bot_msg})
-
-                resp_client = generate_client_response(client_context)
-                if resp_client:
-                    client_reply = extract_client_message(resp_client) or ""
-                    dialogue["dialogue"].append({"role": "client", "message": client_reply})
-                    sign_up_params["city"] = client_reply
-                    client_context.append({"role": "assistant", "content": client_reply})
-                    bot_context.append({"role": "user", "content": client_reply})
-
-            if not sign_up_params["child_name"]:
-                bot_msg = "Як звати вашу дитину?"
-                dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-                bot_context.append({"role": "assistant", "content": bot_msg})
-                client_context.append({"role": "user", "content": bot_msg})
-
-                resp_client = generate_client_response(client_context)
-                if resp_client:
-                    client_reply = extract_client_message(resp_client) or ""
-                    dialogue["dialogue"].append({"role": "client", "message": client_reply})
-                    sign_up_params["child_name"] = client_reply
-                    client_context.append({"role": "assistant", "content": client_reply})
-                    bot_context.append({"role": "user", "content": client_reply})
-
-            if not sign_up_params["phone"]:
-                bot_msg = "На який номер телефону зручно отримати підтвердження?"
-                dialogue["dialogue"].append({"role": "sales_bot", "message": bot_msg})
-                bot_context.append({"role": "assistant", "content": bot_msg})
-                client_context.append({"role": "user", "content": bot_msg})
-
-                resp_client = generate_client_response(client_context)
-                if resp_client:
-                    client_reply = extract_client_message(resp_client) or ""
-                    dialogue["dialogue"].append({"role": "client", "message": client_reply})
-                    sign_up_params["phone"] = client_reply
-                    client_context.append({"role": "assistant", "content": client_reply})
-                    bot_context.append({"role": "user", "content": client_reply})
-
-            arguments = {
-                "city": sign_up_params["city"] or "Dnipro",
-                "child_name": sign_up_params["child_name"] or "Нонейм",
-                "phone": sign_up_params["phone"] or "12345678"
+GREETING = "Вітаю! Я – Штучний інтелект школи усного рахунку «Соробан». Чи є у вас хвилинка поспілкуватися?"
+PRICE_QUESTION = "В якому місті ви проживаєте? І вам зручніше онлайн чи офлайн?"
+GOODBYE_REPLY = "Дякую, успіхів і до побачення!"
+REFUSAL_REPLY = "Зрозуміло, дякую за ваш час! Якщо зміните думку, ми завжди на зв’язку. Успіхів!"
+MAX_REFUSALS = 2
+
+# Воронка записи: слот и вопрос бота по порядку; незаполненные слоты получают значения по умолчанию
+SIGN_UP_SLOTS = (
+    ("city", "Назвіть, будь ласка, місто, в якому ви живете."),
+    ("child_name", "Як звати вашу дитину?"),
+    ("phone", "На який номер телефону зручно отримати підтвердження?"),
+)
+SLOT_DEFAULTS = {"city": "Dnipro", "child_name": "Нонейм", "phone": "12345678"}
+
+# Реакция на намерения клиента: срабатывает первое совпадение по порядку
+INTENT_ACTIONS = (
+    (Intent.GOODBYE, "goodbye"),
+    (Intent.SUCCESS, "sign_up"),
+    (Intent.REFUSAL, "refusal"),
+)
+
+# Состояния автомата: opening — первая реплика клиента после приветствия,
+# exchange — шаги основного цикла, где бот отвечает через LLM
+DIALOGUE_STATES = {
+    "opening": {
+        # ответ на уточнение цены не заменяет исходную реплику клиента
+        "detour_replaces_reply": False,
+        # сбой ответа в воронке прерывает её, и диалог переходит в exchange
+        "abort_sign_up_on_error": True,
+        "goodbye_reason": "клієнт одразу сказав «до побачення»",
+        "success_reason": "успіх з першої ж репліки",
+        "early_stop": False,
+    },
+    "exchange": {
+        "detour_replaces_reply": True,
+        "abort_sign_up_on_error": False,
+        "goodbye_reason": "клієнт сказав до побачення",
+        "success_reason": "успіх",
+        "early_stop": True,
+    },
+}
+
+
+class TurnLog:
+    """
+    Реплики, которые видят LLM. Контексты бота и клиента — одни и те же реплики
+    с переставленными ролями, поэтому хранится один список (кто, текст), а
+    списки сообщений достраиваются из него по запросу, только на новых репликах.
+    """
+
+    __slots__ = ("turns", "_views")
+
+    def __init__(self, bot_system, client_system):
+        self.turns = []
+        self._views = {
+            "bot": [{"role": "system", "content": bot_system}],
+            "client": [{"role": "system", "content": client_system}],
+        }
+
+    def add(self, speaker, text):
+        self.turns.append((speaker, text))
+
+    def context(self, speaker):
+        """Сообщения для LLM в роли speaker: свои реплики — assistant, чужие — user."""
+        view = self._views[speaker]
+        for who, text in self.turns[len(view) - 1:]:
+            view.append({"role": "assistant" if who == speaker else "user", "content": text})
+        return view
+
+
+class Conversation:
+    """Один диалог: журнал реплик, слоты записи и переходы по таблицам выше."""
+
+    def __init__(self, prompt, bot_prompt, index=None, seed=None, policy=EARLY_STOP_POLICY, person=None):
+        # С номером промпта conversation_id воспроизводим: зависит только от (сида, номера)
+        conversation_id = conversation_uuid(index, seed) if index is not None else str(uuid.uuid4())
+        self.state = DialogueState()
+        self.usage = new_usage()
+        self.record = {
+            "conversation_id": conversation_id,
+            "prompt_index": index,
+            # У старых промптов без person_id номер персоны совпадает с номером промпта
+            "person_id": prompt.get("person_id", index),
+            "dialogue": [],
+            "usage": self.usage
+        }
+        if prompt.get("persons_file") is not None:
+            self.record["persons_file"] = prompt["persons_file"]
+        self.success = False
+        self.refusal_count = 0
+        self.sign_up_params = dict.fromkeys(SLOT_DEFAULTS)
+        self.log = TurnLog(bot_prompt, f"Ти — звичайний клієнт. Ось твій опис: {prompt['text']}")
+        self.tracker = policy.tracker(prompt, NUM_EXCHANGES, person) if policy else None
+        self.responder = slot_responder(person, index, seed)
+
+    def say(self, text, in_context=True):
+        """Сценарная реплика бота, без вызова LLM; прощальные в контекст не попадают."""
+        self.record["dialogue"].append({"role": "sales_bot", "message": text})
+        if in_context:
+            self.log.add("bot", text)
+
+    def client_reply(self, slot=None):
+        """
+        Ответ клиента (в записи диалога, но ещё не в журнале) или None при сбое.
+        На вопрос о слоте отвечает персона без LLM, если включён SLOT_RESPONDER.
+        """
+        reply = self.responder.answer(slot) if slot and self.responder else None
+        if reply is None:
+            response = generate_client_response(self.log.context("client"), self.usage)
+            if not response:
+                return None
+            reply = extract_client_message(response) or ""
+        self.record["dialogue"].append({"role": "client", "message": reply})
+        return reply
+
+    def ask(self, question, slot=None):
+        self.say(question)
+        reply = self.client_reply(slot)
+        if reply is not None:
+            self.log.add("client", reply)
+        return reply
+
+    def respond(self, state_name, reply, step=None):
+        """Реакция на реплику клиента в состоянии state_name; True — диалог завершён."""
+        config = DIALOGUE_STATES[state_name]
+        intents = classify(reply)
+        if Intent.PRICE in intents:
+            answer = self.ask(PRICE_QUESTION)
+            if answer is not None and config["detour_replaces_reply"]:
+                reply, intents = answer, classify(answer)
+        self.log.add("client", reply)
+
+        for intent, action in INTENT_ACTIONS:
+            if intent in intents:
+                if getattr(self, action)(config):
+                    return True
+                break
+
+        reason = self.tracker.observe(step, reply, intents) if config["early_stop"] and self.tracker else None
+        if reason:
+            self.say(FINAL_MESSAGE, in_context=False)
+            stop_dialogue(f"рання зупинка: {reason}", self.state)
+            self.record["early_stop"] = {"reason": reason, "exchanges": step + 1,
+                                         **savings(step, NUM_EXCHANGES, self.usage)}
+            return True
+        return False
+
+    def goodbye(self, config):
+        self.say(GOODBYE_REPLY, in_context=False)
+        stop_dialogue(config["goodbye_reason"], self.state)
+        return True
+
+    def sign_up(self, config):
+        self.success = True
+        for slot, question in SIGN_UP_SLOTS:
+            if self.sign_up_params[slot]:
+                continue
+            answer = self.ask(question, slot)
+            if answer is None:
+                if config["abort_sign_up_on_error"]:
+                    return False
+                continue
+            self.sign_up_params[slot] = answer
+
+        arguments = {slot: self.sign_up_params[slot] or default for slot, default in SLOT_DEFAULTS.items()}
+        self.say(format_function_call("sign_for_promo", arguments), in_context=False)
+        handle_ai_function_call({
+            "message": {
+                "function_call": {
+                    "name": "sign_for_promo",
+                    "arguments": json.dumps(arguments)
+                }
             }
-            final_bot = format_function_call("sign_for_promo", arguments)
-            dialogue["dialogue"].append({"role": "sales_bot", "message": final_bot})
-            handle_ai_function_call({
-                "message": {
-                    "function_call": {
-                        "name": "sign_for_promo",
-                        "arguments": json.dumps(arguments)
-                    }
+        }, self.state)
+        stop_dialogue(config["success_reason"], self.state)
+        return True
+
+    def refusal(self, config):
+        self.refusal_count += 1
+        if self.refusal_count < MAX_REFUSALS:
+            return False
+        self.say(REFUSAL_REPLY, in_context=False)
+        handle_ai_function_call({
+            "message": {
+                "function_call": {
+                    "name": "stop_dialogue",
+                    "arguments": '{"reason":"друга відмова"}'
                 }
-            })
-            stop_dialogue("успіх")
-            dialogue_ended = True
-            break
-
-        if is_refusal(client_reply):
-            refusal_count += 1
-            if refusal_count >= 2:
-                final_bot = "Зрозуміло, дякую за ваш час! Якщо зміните думку, ми завжди на зв’язку. Успіхів!"
-                dialogue["dialogue"].append({"role": "sales_bot", "message": final_bot})
-                handle_ai_function_call({
-                    "message": {
-                        "function_call": {
-                            "name": "stop_dialogue",
-                            "arguments": '{"reason":"друга відмова"}'
-                        }
-                    }
-                })
-                dialogue_ended = True
+            }
+        }, self.state)
+        return True
+
+    def run(self):
+        self.say(GREETING)
+        reply = self.client_reply()
+        if reply is None or self.respond("opening", reply):
+            return self.result()
+
+        for step in range(NUM_EXCHANGES):
+            resp_bot = generate_bot_response(self.log.context("bot"), self.usage)
+            if not resp_bot:
                 break
 
-    return dialogue, success
+            bot_msg, stop_called = extract_bot_message_or_stop(resp_bot, self.state)
+            if bot_msg is None:
+                break
+            if bot_msg.strip() != "":
+                self.record["dialogue"].append({"role": "sales_bot", "message": bot_msg})
+            if stop_called:
+                break
+            if is_goodbye(bot_msg):
+                stop_dialogue("бот сказав до побачення", self.state)
+                break
+            self.log.add("bot", bot_msg)
 
-def save_dialogues(dialogues, file_path):
-    if not dialogues:
-        print("❌ Немає діалогів для збереження.")
-        return
+            reply = self.client_reply()
+            if reply is None or self.respond("exchange", reply, step):
+                break
+
+        return self.result()
+
+    def result(self):
+        # Итоги диалога сохраняются в записи при любом из выходов
+        self.record["success"] = self.success
+        self.record["refusal_count"] = self.refusal_count
+        # Поле есть всегда, чтобы у записей одного прогона была одна схема
+        self.record["local_answers"] = self.responder.answered if self.responder else 0
+        return self.record, self.success
+
+
+def create_dialogue(prompt, bot_prompt, index=None, seed=None, policy=EARLY_STOP_POLICY, person=None):
+    return Conversation(prompt, bot_prompt, index, seed, policy, person).run()
+
+def generate_all_dialogues(prompts, bot_prompt, max_workers=MAX_WORKERS, indexes=None, seed=None,
+                           policy=EARLY_STOP_POLICY, persons=None):
+    """
+    Генерирует диалоги параллельно в max_workers потоках.
+    Результаты возвращаются в порядке промптов — так же, как при последовательном запуске.
+    indexes — номера промптов во всём наборе (по умолчанию 0, 1, ...), от них зависят conversation_id.
+    policy — политика ранней остановки (None — без неё).
+    persons — PersonaStore: персона диалога (по person_id промпта) нужна для локальных
+    ответов на слоты и уровня интереса в политике ранней остановки.
+    """
+    if indexes is None:
+        indexes = itertools.count()
+    if seed is None:
+        seed = get_run_seed()
+
+    def run(item):
+        i, prompt = item
+        print(f"\n🛠 Генерується діалог {i+1} для '{prompt['id']}'...\n")
+        person = persons.get(prompt.get("person_id", i)) if persons is not None else None
+        return create_dialogue(prompt, bot_prompt, i, seed, policy, person)
+
+    return ordered_imap(run, zip(indexes, prompts), max_workers)
+
+def save_dialogues(dialogues, file_path, mode="w"):
+    """
+    Пишет диалоги в JSONL по мере их готовности (dialogues может быть генератором),
+    поэтому при сбое сохраняется всё, что уже сгенерировано. Возвращает число записей.
+    mode="a" дописывает к уже сохранённым диалогам при возобновлении прогона.
+    """
+    count = 0
+    # Ловим только ошибки записи: исключения генерации поднимаются из самого
+    # генератора dialogues и не должны выдаваться за сбой сохранения
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(dialogues, f, ensure_ascii=False, indent=4)
-        print(f"\n✅ Діалоги збережено у {file_path}.")
-    except Exception as e:
+        with JsonlWriter(file_path, mode) as writer:
+            for d in dialogues:
+                writer.write(d)
+                count += 1
+    except OSError as e:
         print(f"❌ Помилка при збереженні файлу: {e}")
+        return count
+    if count:
+        print(f"\n✅ Діалоги збережено у {file_path}.")
+    else:
+        print("❌ Немає діалогів для збереження.")
+    return count
 
 def main():
     prompts = load_prompts(PROMPTS_FILE)
@@ -448,21 +460,66 @@ def main():
         print("❌ Немає даних!")
         return
 
-    dialogues = []
+    max_workers = MAX_WORKERS
+    if len(sys.argv) > 2:
+        try:
+            max_workers = int(sys.argv[2])
+        except ValueError:
+            print(f"Невірна кількість потоків, використовується {MAX_WORKERS}")
+
+    manifest = RunManifest()
+    pending, resumed = split_pending(
+        manifest, "dialogues",
+        ((item_id(i, p["text"]), (i, p)) for i, p in enumerate(prompts))
+    )
+    # conversation_id и ответы на слоты выводятся из сида: возобновлённый
+    # запуск продолжает с записанным сидом, как и конвейер, а новый — записывает свой
+    if resumed and manifest.seed is not None:
+        set_run_seed(manifest.seed)
+    manifest.set_seed(get_run_seed())
     success_count = 0
-
-    for i, prompt in enumerate(prompts):
-        print(f"\n🛠 Генерується діалог {i+1} для '{prompt['id']}'...\n")
-        d, success = create_dialogue(prompt, bot_prompt)
-        if d:
-            dialogues.append(d)
-            if success:
-                success_count += 1
-
-    save_dialogues(dialogues, DIALOGUES_FILE)
-
-    print(f"\nЗагальна кількість діалогів: {len(dialogues)}")
+    total_usage = new_usage()
+    total_savings = new_savings()
+    local_answers = 0
+    # person_id промптов — номера в файле персон, из которого они построены:
+    # у prompts.json это persons.json отдельного запуска generate_prompts
+    persons_file = persons_path(prompts[0], PERSONS_FILE)
+    persons = load_persona_store(persons_file)
+    # Диалоги запоминают файл персон, чтобы хранилище, экспорт и отчёты нашли ту же персону
+    for prompt in prompts:
+        prompt.setdefault("persons_file", os.path.basename(persons_file))
+
+    def finished_dialogues():
+        nonlocal success_count, local_answers
+        results = generate_all_dialogues(
+            [p for _, (_, p) in pending], bot_prompt, max_workers,
+            indexes=[i for _, (i, _) in pending], persons=persons
+        )
+        for (iid, _), (d, success) in zip(pending, results):
+            if d:
+                if success:
+                    success_count += 1
+                add_usage(total_usage, d["usage"])
+                add_savings(total_savings, d.get("early_stop"))
+                local_answers += d.get("local_answers", 0)
+                yield d
+            # Отмечаем только после того, как save_dialogues записал диалог
+            manifest.mark_done("dialogues", iid)
+        # Сюда доходим, только если записаны все диалоги
+        finish_stage(manifest, "dialogues")
+
+    total = save_dialogues(finished_dialogues(), DIALOGUES_FILE, "a" if resumed else "w")
+    manifest.close()
+
+    print(f"\nЗагальна кількість діалогів: {total}")
     print(f"Успішних діалогів (запис на курс): {success_count}")
+    print(f"LLM: {format_usage(total_usage)}")
+    if EARLY_STOP_POLICY:
+        print(f"Рання зупинка: {format_savings(total_savings)}")
+    if SLOT_RESPONDER:
+        print(f"Відповідей на слоти без LLM: {local_answers}")
+    report_cache_stats("dialogues")
+    export_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,13 @@
 import os
 import json
 import random
-import re
 import sys
+from bisect import bisect
+from itertools import accumulate
+
+from city_sampler import load_city_sampler
+from seeding import item_rng, item_rngs, get_run_seed
+from jsonl_io import write_json_array
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
 OUTPUT_FILE = os.path.join(DATA_DIR, "persons.json")
@@ -25,114 +30,136 @@ CHILD_NAMES = [
     "Соломія", "Катруся", "Петрик", "Андрійко", "Даринка"
 ]
 
-def load_json(file_path: str):
-    if not os.path.exists(file_path):
-        print(f"❌ Файл {file_path} не знайдено!")
-        return {}
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data if data else {}
-
-def pick_level(weights):
-    levels = list(range(10))
-    return random.choices(levels, weights=weights, k=1)[0]
-
-def generate_ukr_phone_number() -> str:
-    operators = ["50","63","66","67","68","91","92","93","94","95","96","97","98","99"]
-    operator_code = random.choice(operators)
-    last_8_digits = random.randint(10_000_000, 99_999_999)
-    last_7_str = str(last_8_digits)[1:]
-    return f"0{operator_code}{last_7_str}"
+NAMES = [
+    "Анна", "Іван", "Софія", "Максим", "Олексій", "Юлія",
+    "Марія", "Олена", "Тетяна", "Олег", "Тарас", "Наталя",
+    "Володимир", "Оксана", "Катерина", "Петро"
+]
+HOBBIES = [
+    "читання", "футбол", "подорожі", "малювання", "випікання",
+    "шахи", "садівництво", "скандинавська ходьба", "велоспорт", "йога"
+]
+PROFESSIONS = [
+    "вчитель", "підприємець", "лікар", "дизайнер", "механік",
+    "інженер", "журналіст", "перекладач", "фотограф", "менеджер"
+]
+CHARACTERS = ["емпат", "логік", "екстраверт", "інтроверт"]
+VALUES = ["сім'я", "кар'єра", "екологія", "подорожі", "здоров'я"]
+MARITAL_STATUSES = ["одружений", "розлучений", "самотній"]
+POLITICAL_VIEWS_OPTIONS = ["консерватор", "ліберал", "аполітичний", "поміркований"]
+GENDERS = ["чоловіча", "жіноча"]
+PHONE_OPERATORS = ["50","63","66","67","68","91","92","93","94","95","96","97","98","99"]
+
+LEVELS = list(range(10))
+AGES = list(range(20, 61))
+# Кумулятивные веса считаются один раз, а не на каждый random.choices
+INTEREST_CUM_WEIGHTS = list(accumulate(INTEREST_WEIGHTS))
+AVAILABILITY_CUM_WEIGHTS = list(accumulate(AVAILABILITY_WEIGHTS))
 
 def load_cities():
-    data = load_json(CITIES_FILE)
-    result = []
-    for city_key, city_info in data.items():
-        prob = city_info.get("probability", 0.0)
-        result.append((city_key, prob, city_info))
-    return result
-
-def pick_city(cities_data):
-    if not cities_data:
-        return ("Невідоме місто", "Невідома країна")
-    keys = [cd[0] for cd in cities_data]
-    probs = [cd[1] for cd in cities_data]
-    infos = [cd[2] for cd in cities_data]
-    chosen_idx = random.choices(range(len(keys)), weights=probs, k=1)[0]
-    chosen_info = infos[chosen_idx]
-    city_variants = chosen_info.get("city", [])
-    if not city_variants:
-        city_variants = [keys[chosen_idx]]
-    chosen_variant = random.choice(city_variants)
-    chosen_variant_clean = re.sub(r'^[0-9]+\)\s*', '', chosen_variant).strip()
-    country = chosen_info.get("country", "Невідома країна")
-    return (chosen_variant_clean, country)
-
-def generate_person(cities_data):
-    names = [
-        "Анна", "Іван", "Софія", "Максим", "Олексій", "Юлія",
-        "Марія", "Олена", "Тетяна", "Олег", "Тарас", "Наталя",
-        "Володимир", "Оксана", "Катерина", "Петро"
-    ]
-    hobbies = [
-        "читання", "футбол", "подорожі", "малювання", "випікання",
-        "шахи", "садівництво", "скандинавська ходьба", "велоспорт", "йога"
-    ]
-    professions = [
-        "вчитель", "підприємець", "лікар", "дизайнер", "механік",
-        "інженер", "журналіст", "перекладач", "фотограф", "менеджер"
-    ]
-    characters = ["емпат", "логік", "екстраверт", "інтроверт"]
-    values = ["сім'я", "кар'єра", "екологія", "подорожі", "здоров'я"]
-    marital_statuses = ["одружений", "розлучений", "самотній"]
-    political_views_options = ["консерватор", "ліберал", "аполітичний", "поміркований"]
-
-    name = random.choice(names)
-    age = random.randint(20, 60)
-    interest_level = pick_level(INTEREST_WEIGHTS)
-    availability_level = pick_level(AVAILABILITY_WEIGHTS)
-    phone = generate_ukr_phone_number()
-    chosen_city, chosen_country = pick_city(cities_data)
-
-    person = {
-        "name": name,
+    return load_city_sampler(CITIES_FILE)
+
+def pick_city(city_sampler, rng=random):
+    return city_sampler.sample(rng)
+
+def pick_level(cum_weights, rng=random):
+    return rng.choices(LEVELS, cum_weights=cum_weights, k=1)[0]
+
+def generate_ukr_phone_number(rng=random) -> str:
+    return f"0{rng.choice(PHONE_OPERATORS)}{rng.randrange(10_000_000):07d}"
+
+def generate_person(city_sampler, rng=random):
+    """
+    Одна персона из генератора rng. С rng из seeding.item_rng персона —
+    чистая функция (сида, номера), см. generate_person_at.
+    """
+    age = rng.choice(AGES)
+    interest_level = pick_level(INTEREST_CUM_WEIGHTS, rng)
+    chosen_city, chosen_country = pick_city(city_sampler, rng)
+    return {
+        "name": rng.choice(NAMES),
         "age": age,
-        "gender": random.choice(["чоловіча", "жіноча"]),
-        "hobbies": random.choice(hobbies),
-        "profession": random.choice(professions),
-        "character": random.choice(characters),
-        "values": random.choice(values),
-        "marital_status": random.choice(marital_statuses),
-        "political_views": random.choice(political_views_options),
+        "gender": rng.choice(GENDERS),
+        "hobbies": rng.choice(HOBBIES),
+        "profession": rng.choice(PROFESSIONS),
+        "character": rng.choice(CHARACTERS),
+        "values": rng.choice(VALUES),
+        "marital_status": rng.choice(MARITAL_STATUSES),
+        "political_views": rng.choice(POLITICAL_VIEWS_OPTIONS),
         "interest": interest_level,
         "tone": interest_level,
-        "mood": availability_level,
-        "phone": phone,
+        "mood": pick_level(AVAILABILITY_CUM_WEIGHTS, rng),
+        "phone": generate_ukr_phone_number(rng),
         "city": chosen_city,
-        "country": chosen_country
+        "country": chosen_country,
+        "children": generate_children(age, interest_level, rng)
     }
 
-    if interest_level > 5:
-        num_children = random.randint(1, 3)
-        max_child_age = min(age - 15, 18)
-        if max_child_age < 3:
-            max_child_age = 3
-        children = []
-        for _ in range(num_children):
-            c_age = random.randint(3, max_child_age)
-            c_name = random.choice(CHILD_NAMES)
-            children.append({"name": c_name, "age": c_age})
-        person["children"] = children
-    else:
-        person["children"] = []
-
-    return person
-
-def generate_persons(file_path, count=DEFAULT_NUM_PERSONS):
-    cities_data = load_cities()
-    persons = [generate_person(cities_data) for _ in range(count)]
-    with open(file_path, "w", encoding="utf-8") as file:
-        json.dump(persons, file, ensure_ascii=False, indent=4)
+def generate_children(age, interest_level, rng=random):
+    if interest_level <= 5:
+        return []
+    num_children = rng.randint(1, 3)
+    max_child_age = min(age - 15, 18)
+    if max_child_age < 3:
+        max_child_age = 3
+    children = []
+    for _ in range(num_children):
+        c_age = rng.randint(3, max_child_age)
+        c_name = rng.choice(CHILD_NAMES)
+        children.append({"name": c_name, "age": c_age})
+    return children
+
+def generate_person_at(index, city_sampler, seed=None):
+    """Персона номер index прогона с сидом seed; не зависит от остальных персон."""
+    return generate_person(city_sampler, item_rng("persons", index, seed))
+
+def generate_persons_at(start, count, city_sampler, seed=None):
+    """
+    Персоны start..start+count-1 — те же, что generate_person_at по одной (те же
+    вызовы к тем же генераторам), но для потока: генератор пересевается, а не
+    создаётся, взвешенный выбор уровня — bisect по готовым кумулятивным весам,
+    методы rng привязаны локально.
+    """
+    interest_total = INTEREST_CUM_WEIGHTS[-1] + 0.0
+    mood_total = AVAILABILITY_CUM_WEIGHTS[-1] + 0.0
+    hi = len(LEVELS) - 1
+    sample_city = city_sampler.sample
+    for rng in item_rngs("persons", start, count, seed):
+        choice = rng.choice
+        rand = rng.random
+        age = choice(AGES)
+        # То же, что rng.choices(LEVELS, cum_weights=..., k=1)[0]
+        interest_level = LEVELS[bisect(INTEREST_CUM_WEIGHTS, rand() * interest_total, 0, hi)]
+        chosen_city, chosen_country = sample_city(rng)
+        yield {
+            "name": choice(NAMES),
+            "age": age,
+            "gender": choice(GENDERS),
+            "hobbies": choice(HOBBIES),
+            "profession": choice(PROFESSIONS),
+            "character": choice(CHARACTERS),
+            "values": choice(VALUES),
+            "marital_status": choice(MARITAL_STATUSES),
+            "political_views": choice(POLITICAL_VIEWS_OPTIONS),
+            "interest": interest_level,
+            "tone": interest_level,
+            "mood": LEVELS[bisect(AVAILABILITY_CUM_WEIGHTS, rand() * mood_total, 0, hi)],
+            "phone": f"0{choice(PHONE_OPERATORS)}{rng.randrange(10_000_000):07d}",
+            "city": chosen_city,
+            "country": chosen_country,
+            "children": generate_children(age, interest_level, rng)
+        }
+
+def iter_persons(count=DEFAULT_NUM_PERSONS, city_sampler=None, seed=None, start=0):
+    if city_sampler is None:
+        city_sampler = load_cities()
+    if seed is None:
+        seed = get_run_seed()
+    return generate_persons_at(start, count, city_sampler, seed)
+
+def generate_persons(file_path, count=DEFAULT_NUM_PERSONS, seed=None):
+    # Персоны пишутся по одной, в прежнем формате persons.json — список в памяти не строится
+    count = write_json_array(iter_persons(count, seed=seed), file_path)
     print(f"{count} персон успішно збережено у {file_path}!")
 
 def main():
@@ -144,8 +171,8 @@ def main():
             print(f"Невірний аргумент, використовується значення за замовчуванням: {DEFAULT_NUM_PERSONS}")
             count = DEFAULT_NUM_PERSONS
 
-    cities_data = load_cities()
-    single_person = generate_person(cities_data)
+    city_sampler = load_cities()
+    single_person = generate_person_at(0, city_sampler)
     print("Приклад однієї персони (відображається у консолі):")
     print(json.dumps(single_person, ensure_ascii=False, indent=4))
     generate_persons(OUTPUT_FILE, count)
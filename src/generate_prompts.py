@@ -2,10 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import json
 import random
+import itertools
 import sys
 
+from seeding import item_rng, get_run_seed
+from jsonl_io import iter_records, write_json_array
+
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
 PERSONS_FILE = os.path.join(DATA_DIR, "persons.json")
 OBJECTIONS_FILE = os.path.join(DATA_DIR, "objections.json")
@@ -65,6 +70,17 @@ MOOD_STR_MAP = {
     9: "Енергійний і дуже доброзичливий"
 }
 
+_INTEREST_BY_LABEL = {label: level for level, label in INTEREST_STR_MAP.items()}
+_INTEREST_LINE = re.compile(r"Рівень інтересу:\s*([^.\n]+)")
+
+def parse_interest(text):
+    """Уровень интереса из строки «Рівень інтересу: …» промпта или None, если строки нет."""
+    match = _INTEREST_LINE.search(text)
+    if not match:
+        return None
+    label = match.group(1).strip()
+    return int(label) if label.isdigit() else _INTEREST_BY_LABEL.get(label)
+
 def rewrite_phrases(reasons_map):
     for reason_key, reason_phrases in reasons_map.items():
         reasons_map[reason_key] = [
@@ -78,18 +94,8 @@ def load_json(file_path):
     with open(file_path, "r", encoding="utf-8") as file:
         return json.load(file)
 
-def generate_prompts():
-    if len(sys.argv) > 1:
-        try:
-            num_prompts = int(sys.argv[1])
-        except ValueError:
-            print(f"Невірний аргумент, використовується значення за замовчуванням: {DEFAULT_NUM_PROMPTS}")
-            num_prompts = DEFAULT_NUM_PROMPTS
-    else:
-        num_prompts = DEFAULT_NUM_PROMPTS
-
-    persons = load_json(PERSONS_FILE)
-    objections_map = load_json(OBJECTIONS_FILE)
+def load_reasons(objections_file=OBJECTIONS_FILE):
+    objections_map = load_json(objections_file)
 
     reasons_map = objections_map.get("reasons", {})
     rewrite_phrases(reasons_map)
@@ -97,58 +103,125 @@ def generate_prompts():
     all_reason_keys = list(reasons_map.keys())
     if "no_children" in all_reason_keys:
         all_reason_keys.remove("no_children")
+    return reasons_map, all_reason_keys
+
+HEADER = (
+    "Ти не бот, а реальна людина. Говори лише від першої особи.\n"
+    "Не використовуй другу особу (ти, твій, ваш) у відповідях.\n"
+    "Не озвучуй ціни самостійно після викликів get_price(), лише сприймай інформацію від бота.\n"
+    "Сприймай JSON-відповіді (get_price, запис на урок) як інформацію, а не як код.\n"
+)
+HIGH_INTEREST_LINE = (
+    "Оскільки в мене досить високий інтерес, я можу поцікавитися ціною і погодитися на пробний урок.\n"
+)
+SIGN_UP_LINE = (
+    "Якщо мене переконають у перевагах саме для дитини 5–12 років, можу записатися після уточнення ціни.\n"
+)
+NO_REASON = "Нема конкретної причини."
+NO_CHILDREN = "У мене немає дітей."
+
+
+class PromptTemplate:
+    """
+    Шаблон промпта, подготовленный один раз: подписи уровней, типовые ответы и
+    строки возражений уже отрендерены, возражения лежат одним плоским кортежем, а
+    причина — диапазон индексов в нём. На персону остаются подстановки её полей
+    и выбор строк; последовательность вызовов rng та же, что и раньше, поэтому
+    при том же сиде промпты совпадают байт в байт.
+    """
+
+    def __init__(self, objections_file=OBJECTIONS_FILE):
+        reasons_map, all_reason_keys = load_reasons(objections_file)
+        reason_lines = []
+        reason_ranges = []
+        for key in all_reason_keys:
+            phrases = reasons_map.get(key) or [NO_REASON]
+            start = len(reason_lines)
+            reason_lines.extend(f"Я сумніваюся і думаю, що: «{phrase}»" for phrase in phrases)
+            reason_ranges.append(range(start, len(reason_lines)))
+        self.reason_lines = tuple(reason_lines)
+        self.reason_ranges = tuple(reason_ranges)
+        self.interest_lines = {level: f"Рівень інтересу: {label}.\n" for level, label in INTEREST_STR_MAP.items()}
+        self.tone_lines = {level: f"Тон: {label}.\n" for level, label in TONE_STR_MAP.items()}
+        self.mood_lines = {level: f"Настрій: {label}.\n" for level, label in MOOD_STR_MAP.items()}
+        self.short_response_lines = tuple(
+            f"Початкова типова відповідь: «{response}»\n" for response in SHORT_RESPONSES
+        )
 
-    prompts = []
-
-    for person in persons[:num_prompts]:
+    def render(self, person, rng=random, person_id=None, persons_file=None):
         children = person.get("children", [])
-        children_str = (
-            f"У мене {len(children)} діточок: " + ", ".join(
-                f"{ch['name']} ({ch['age']} років)" for ch in children
-            ) + "."
-            if children else "У мене немає дітей."
-        )
+        if children:
+            children_line = (
+                f"У мене {len(children)} діточок: "
+                + ", ".join(f"{ch['name']} ({ch['age']} років)" for ch in children)
+                + ".\n"
+            )
+        else:
+            children_line = NO_CHILDREN + "\n"
 
-        high_interest_line = ""
-        sign_up_line = ""
+        interest_extra = ""
         if person.get("interest", 0) >= 5:
-            high_interest_line = (
-                "Оскільки в мене досить високий інтерес, я можу поцікавитися ціною і погодитися на пробний урок.\n"
-            )
+            interest_extra = HIGH_INTEREST_LINE
             if any(5 <= ch["age"] <= 12 for ch in children):
-                sign_up_line = (
-                    "Якщо мене переконають у перевагах саме для дитини 5–12 років, можу записатися після уточнення ціни.\n"
-                )
+                interest_extra += SIGN_UP_LINE
 
-        chosen_reason_text = random.choice(
-            reasons_map.get(random.choice(all_reason_keys), ["Нема конкретної причини."])
-        )
+        reason_line = self.reason_lines[rng.choice(rng.choice(self.reason_ranges))]
+        short_response_line = rng.choice(self.short_response_lines)
 
-        prompt_text = (
-            "Ти не бот, а реальна людина. Говори лише від першої особи.\n"
-            "Не використовуй другу особу (ти, твій, ваш) у відповідях.\n"
-            "Не озвучуй ціни самостійно після викликів get_price(), лише сприймай інформацію від бота.\n"
-            "Сприймай JSON-відповіді (get_price, запис на урок) як інформацію, а не як код.\n"
+        text = "".join((
+            HEADER,
             f"Місто: {person['city']}, країна: {person['country']}.\n"
             f"Телефон: {person['phone']}.\n"
             f"Мене звати {person['name']}, мені {person['age']} років, працюю {person['profession']}.\n"
             f"Моє хобі: {person['hobbies']}.\n"
-            f"Характер: {person['character']}.\n"
-            f"{children_str}\n"
-            f"Рівень інтересу: {INTEREST_STR_MAP[person['interest']]}.\n"
-            f"Тон: {TONE_STR_MAP[person['tone']]}.\n"
-            f"Настрій: {MOOD_STR_MAP[person['mood']]}.\n"
-            "Відповідаю завжди одним реченням.\n"
-            f"{high_interest_line}"
-            f"{sign_up_line}"
-            f"Початкова типова відповідь: «{random.choice(SHORT_RESPONSES)}»\n"
-            f"Я сумніваюся і думаю, що: «{chosen_reason_text}»"
-        )
+            f"Характер: {person['character']}.\n",
+            children_line,
+            self.interest_lines[person['interest']],
+            self.tone_lines[person['tone']],
+            self.mood_lines[person['mood']],
+            "Відповідаю завжди одним реченням.\n",
+            interest_extra,
+            short_response_line,
+            reason_line,
+        ))
+
+        # Имя не уникально: со структурированной персоной промпт связывает person_id
+        prompt = {"id": person['name'], "text": text}
+        if person_id is not None:
+            prompt["person_id"] = person_id
+        # person_id — номер строки, поэтому рядом записан файл персон, к которому он относится
+        if persons_file is not None:
+            prompt["persons_file"] = persons_file
+        return prompt
+
+    def render_all(self, persons, seed=None, start=0, persons_file=None):
+        """
+        Промпты по одному на персону; номер персоны (start, start+1, ...) — её person_id.
+        persons_file — имя файла персон в data/, из которого взяты persons.
+        """
+        if seed is None:
+            seed = get_run_seed()
+        for index, person in enumerate(persons, start):
+            yield self.render(person, item_rng("prompts", index, seed), index, persons_file)
+
+
+def iter_prompts(persons, seed=None, template=None, persons_file=None):
+    """Промпт номер i зависит только от персоны i и сида прогона."""
+    return (template or PromptTemplate()).render_all(persons, seed, persons_file=persons_file)
 
-        prompts.append({"id": person['name'], "text": prompt_text.strip()})
+def generate_prompts():
+    if len(sys.argv) > 1:
+        try:
+            num_prompts = int(sys.argv[1])
+        except ValueError:
+            print(f"Невірний аргумент, використовується значення за замовчуванням: {DEFAULT_NUM_PROMPTS}")
+            num_prompts = DEFAULT_NUM_PROMPTS
+    else:
+        num_prompts = DEFAULT_NUM_PROMPTS
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as file:
-        json.dump(prompts, file, ensure_ascii=False, indent=4)
+    # Персоны читаются и промпты пишутся по одной — память не зависит от числа промптов
+    persons = itertools.islice(iter_records(PERSONS_FILE), num_prompts)
+    write_json_array(iter_prompts(persons, persons_file=os.path.basename(PERSONS_FILE)), OUTPUT_FILE)
 
 if __name__ == "__main__":
     generate_prompts()
\ No newline at end of file
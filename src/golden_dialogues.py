@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import random
+import hashlib
+import contextlib
+
+# Проверка работает без сети и не должна ни читать, ни засорять кеш ответов
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ["GPT_CACHE_MODE"] = "bypass"
+
+import gpt_client
+import slot_responder
+from fake_llm import FakeChatCompletion
+from jsonl_io import JsonlWriter, iter_jsonl
+from early_stop import EarlyStopPolicy
+from generate_persons import load_cities, generate_person
+from generate_prompts import PromptTemplate
+from generate_dialogues import create_dialogue, load_file, BOT_PROMPT_FILE
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+# Эталон: сначала промпты с персонами (по строке на номер), затем по каждому
+# сценарию запись диалога и хеш всех запросов к LLM
+GOLDEN_FILE = os.path.join(DATA_DIR, "golden_dialogues.jsonl")
+
+GOLDEN_SEED = 1
+GOLDEN_PROMPTS = 16
+# Каждый пятый по хешу запрос к LLM падает без повторов (сценарий errors)
+ERROR_EVERY = 5
+
+
+class Scenario:
+    """Вариант прогона: политика ранней остановки, локальные ответы на слоты, сбои LLM."""
+
+    def __init__(self, name, policy=None, slot_answers=False, errors=False):
+        self.name = name
+        self.policy = policy
+        self.slot_answers = slot_answers
+        self.errors = errors
+
+
+SCENARIOS = [
+    Scenario("plain"),
+    Scenario("early_stop", policy=EarlyStopPolicy()),
+    # Короткие лимиты: ранняя остановка срабатывает и на фейковом бэкенде
+    Scenario("early_stop_tight", policy=EarlyStopPolicy(rules=[(9, 2, 1, 1)])),
+    Scenario("slot_responder", slot_answers=True),
+    Scenario("errors", errors=True),
+]
+
+
+class RecordingBackend:
+    """Фейковый бэкенд, который копит запросы текущего диалога и при errors роняет часть из них."""
+
+    def __init__(self):
+        self.fake = FakeChatCompletion(seed=0, latency=0.0, latency_jitter=0.0, error_rate=0.0)
+        self.requests = []
+        self.errors = False
+
+    def create(self, **kwargs):
+        request = json.dumps(kwargs, ensure_ascii=False, sort_keys=True)
+        self.requests.append(request)
+        if self.errors and int(hashlib.sha256(request.encode("utf-8")).hexdigest(), 16) % ERROR_EVERY == 0:
+            raise ValueError("golden: injected error")
+        return self.fake.create(**kwargs)
+
+    def digest(self):
+        requests, self.requests = self.requests, []
+        return hashlib.sha256("\n".join(requests).encode("utf-8")).hexdigest()
+
+
+def golden_inputs(count=GOLDEN_PROMPTS, seed=GOLDEN_SEED):
+    """Персоны и промпты эталона; с разными уровнями интереса за счёт фиксированного сида."""
+    sampler = load_cities()
+    rng = random.Random(seed)
+    persons = [generate_person(sampler, rng) for _ in range(count)]
+    prompts = list(PromptTemplate().render_all(persons, seed=seed))
+    return list(zip(prompts, persons))
+
+
+def run_scenario(scenario, inputs, bot_prompt, backend):
+    backend.errors = scenario.errors
+    saved = slot_responder.SLOT_RESPONDER
+    slot_responder.SLOT_RESPONDER = scenario.slot_answers
+    try:
+        # Журнал отдельных диалогов в проверке не нужен
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for index, (prompt, person) in enumerate(inputs):
+                record, _ = create_dialogue(prompt, bot_prompt, index, GOLDEN_SEED, scenario.policy, person)
+                yield {
+                    "scenario": scenario.name,
+                    "index": index,
+                    "record": record,
+                    "requests_sha256": backend.digest(),
+                }
+    finally:
+        slot_responder.SLOT_RESPONDER = saved
+        backend.errors = False
+
+
+def _install_backend():
+    backend = RecordingBackend()
+    gpt_client.set_backend(backend.create)
+    gpt_client.BACKOFF_BASE = 0.0
+    return backend
+
+
+def update_golden(file_path=GOLDEN_FILE):
+    """Перезаписывает эталон текущим поведением create_dialogue."""
+    backend = _install_backend()
+    bot_prompt = load_file(BOT_PROMPT_FILE)
+    inputs = golden_inputs()
+    with JsonlWriter(file_path) as writer:
+        for index, (prompt, person) in enumerate(inputs):
+            writer.write({"index": index, "prompt": prompt, "person": person})
+        for scenario in SCENARIOS:
+            for entry in run_scenario(scenario, inputs, bot_prompt, backend):
+                writer.write(entry)
+    print(f"📌 Еталон оновлено: {len(inputs)} промптів, {len(SCENARIOS)} сценаріїв у {file_path}")
+
+
+def _first_difference(expected, actual):
+    """Первое расхождение записей диалога, для сообщения об ошибке."""
+    for i, (want, got) in enumerate(zip(expected["dialogue"], actual["dialogue"])):
+        if want != got:
+            return f"репліка {i}: очікувалось {want!r}, отримано {got!r}"
+    if len(expected["dialogue"]) != len(actual["dialogue"]):
+        return f"довжина діалогу {len(expected['dialogue'])} → {len(actual['dialogue'])}"
+    keys = sorted(key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key))
+    return f"поля запису: {', '.join(keys)}" if keys else "запити до LLM"
+
+
+def check_golden(file_path=GOLDEN_FILE):
+    """
+    Повторяет диалоги эталона на его же промптах и персонах и сравнивает записи
+    и хеши запросов к LLM. Возвращает список расхождений.
+    """
+    backend = _install_backend()
+    bot_prompt = load_file(BOT_PROMPT_FILE)
+    inputs = []
+    golden = {}
+    for entry in iter_jsonl(file_path):
+        if "scenario" in entry:
+            golden.setdefault(entry["scenario"], []).append(entry)
+        else:
+            inputs.append((entry["prompt"], entry["person"]))
+
+    failures = []
+    for scenario in SCENARIOS:
+        expected = golden.pop(scenario.name, [])
+        if not expected:
+            failures.append(f"{scenario.name}: немає в еталоні")
+            continue
+        for want, got in zip(expected, run_scenario(scenario, inputs, bot_prompt, backend)):
+            if want["record"] != got["record"] or want["requests_sha256"] != got["requests_sha256"]:
+                failures.append(f"{scenario.name} #{want['index']}: "
+                                f"{_first_difference(want['record'], got['record'])}")
+    failures.extend(f"{name}: сценарію вже немає" for name in golden)
+    return failures
+
+
+def main():
+    args = sys.argv[1:]
+    if "--update" in args:
+        update_golden()
+        return
+    if not os.path.exists(GOLDEN_FILE):
+        print(f"❌ Еталону {GOLDEN_FILE} немає, створіть його з --update")
+        sys.exit(2)
+
+    failures = check_golden()
+    if failures:
+        print(f"❌ Розбіжностей з еталоном: {len(failures)}")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"✅ Діалоги збігаються з еталоном {GOLDEN_FILE}")
+
+
+if __name__ == "__main__":
+    main()
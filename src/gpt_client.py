@@ -0,0 +1,198 @@
+import os
+import json
+import random
+import threading
+import time
+
+import openai
+from dotenv import load_dotenv
+
+import metrics
+from response_cache import cache_key, get_cache, CACHE_HIT_KEY
+
+load_dotenv()
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# openai — живой API, fake — детерминированная заглушка из fake_llm (без сети)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# Квоты аккаунта: все вызовы ChatCompletion из src/ делят одни и те же ведра
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_RPM", "500"))
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TPM", "30000"))
+
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+BACKOFF_BASE = 1.0   # секунды, удваивается с каждой попыткой
+BACKOFF_MAX = 60.0
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+)
+
+
+class TokenBucket:
+    """Потокобезопасное ведро токенов, пополняется равномерно до capacity за минуту."""
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1.0):
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, delta):
+        """Возвращает (delta > 0) или дозабирает (delta < 0) токены после фактического usage."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + delta)
+
+
+_request_bucket = TokenBucket(REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(TOKENS_PER_MINUTE)
+
+# Retry-After от сервера приостанавливает всех вызывающих, а не только получившего 429
+_pause_lock = threading.Lock()
+_paused_until = 0.0
+
+
+_backend_create = None
+_backend_rate_limited = True
+
+
+def set_backend(create, rate_limited=False):
+    """
+    Подменяет функцию, выполняющую ChatCompletion (сигнатура как у
+    openai.ChatCompletion.create). Для заглушек лимиты RPM/TPM обычно не нужны.
+    """
+    global _backend_create, _backend_rate_limited
+    _backend_create = create
+    _backend_rate_limited = rate_limited
+
+
+def _get_backend():
+    global _backend_create, _backend_rate_limited
+    if _backend_create is None:
+        if LLM_BACKEND == "fake":
+            from fake_llm import FakeChatCompletion
+            set_backend(FakeChatCompletion().create)
+        elif LLM_BACKEND == "openai":
+            _backend_create = openai.ChatCompletion.create
+            _backend_rate_limited = True
+        else:
+            raise ValueError(f"Невідомий LLM_BACKEND: {LLM_BACKEND}")
+    return _backend_create
+
+
+def _pause(seconds):
+    global _paused_until
+    with _pause_lock:
+        _paused_until = max(_paused_until, time.monotonic() + seconds)
+
+
+def _wait_for_pause():
+    while True:
+        with _pause_lock:
+            wait = _paused_until - time.monotonic()
+        if wait <= 0:
+            return
+        time.sleep(wait)
+
+
+def estimate_tokens(kwargs):
+    """Грубая оценка: ~3 символа кириллицы на токен плюс максимум ответа."""
+    payload = json.dumps(kwargs.get("messages", []), ensure_ascii=False)
+    if kwargs.get("functions"):
+        payload += json.dumps(kwargs["functions"], ensure_ascii=False)
+    return len(payload) // 3 + int(kwargs.get("max_tokens") or 0)
+
+
+def is_retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return getattr(error, "http_status", None) in RETRYABLE_STATUSES
+
+
+def retry_after_seconds(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def backoff_delay(attempt):
+    """Экспоненциальная задержка с полным джиттером."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def chat_completion(stage="gpt", **kwargs):
+    """
+    Единая точка вызова ChatCompletion для всех стадий:
+    кеш ответов, ограничение RPM/TPM, повторы с джиттером и учёт Retry-After.
+    Ответ из локального кеша помечен CACHE_HIT_KEY.
+    После MAX_RETRIES неудачных попыток пробрасывает последнюю ошибку.
+    """
+    cache = get_cache()
+    key = cache_key(kwargs)
+    cached = cache.get(key, stage)
+    if cached is not None:
+        metrics.record_cache_hit(stage)
+        cached[CACHE_HIT_KEY] = True
+        return cached
+
+    create = _get_backend()
+    estimated = estimate_tokens(kwargs)
+    attempt = 0
+    while True:
+        _wait_for_pause()
+        if _backend_rate_limited:
+            _request_bucket.acquire(1)
+            _token_bucket.acquire(estimated)
+        started = time.perf_counter()
+        try:
+            response = create(**kwargs)
+        except Exception as e:
+            metrics.record_error(stage, e, time.perf_counter() - started)
+            if not is_retryable(e) or attempt >= MAX_RETRIES:
+                raise
+            metrics.record_retry(stage)
+            delay = retry_after_seconds(e)
+            if delay is not None:
+                _pause(delay)
+            else:
+                delay = backoff_delay(attempt)
+            attempt += 1
+            print(f"⚠️ [{stage}] {type(e).__name__}: повтор {attempt}/{MAX_RETRIES} через {delay:.1f} с")
+            time.sleep(delay)
+            continue
+
+        metrics.record_call(stage, time.perf_counter() - started, response)
+        usage = response.get("usage") if hasattr(response, "get") else None
+        if _backend_rate_limited and usage and usage.get("total_tokens") is not None:
+            _token_bucket.adjust(estimated - usage["total_tokens"])
+        cache.put(key, response)
+        return response
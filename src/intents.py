@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+from enum import IntFlag
+
+SUCCESS_KEYWORDS = [
+    "запишіть", "як записатися", "як можна записатися", "пробний урок",
+    "хочу спробувати", "давайте спробуємо", "я згоден", "я згідна",
+    "так, хочу", "так, згоден", "так, згодна"
+]
+
+GOODBYE_KEYWORDS = [
+    r"\bдо\s+побачення\b",
+    r"\bдо\s+зустрічі\b",
+    r"\bпрощавай\b",
+    r"\bбувай\b"
+]
+
+REFUSAL_KEYWORDS = [
+    "не цікаво", "не потрібно", "відмовляюся", "не маю часу",
+    "не планую", "не зацікавлена", "не підходить", "ні, дякую"
+]
+
+PRICE_KEYWORDS = ["скільки коштує"]
+
+
+class Intent(IntFlag):
+    NONE = 0
+    GOODBYE = 1
+    PRICE = 2
+    REFUSAL = 4
+    SUCCESS = 8
+
+
+def _build_pattern():
+    """
+    Одно регулярное выражение на все категории, каждая — именованная группа, и
+    отдельные выражения категорий. Общее находит позиции совпадений; в каждой
+    из них остальные категории проверяются своими выражениями, потому что
+    альтернация отдаёт только одну группу, а ключевые слова разных категорий
+    могут начинаться в одной позиции. Поиск возобновляется со следующего
+    символа, так что перекрывающиеся совпадения тоже находятся.
+    """
+    categories = [
+        (Intent.GOODBYE, GOODBYE_KEYWORDS),
+        (Intent.PRICE, [re.escape(kw) for kw in PRICE_KEYWORDS]),
+        (Intent.REFUSAL, [re.escape(kw) for kw in REFUSAL_KEYWORDS]),
+        (Intent.SUCCESS, [re.escape(kw) for kw in SUCCESS_KEYWORDS]),
+    ]
+    groups = [f"(?P<{intent.name}>{'|'.join(patterns)})" for intent, patterns in categories]
+    # В match(text, pos) \b смотрит и на символ перед pos, как при поиске по всему тексту
+    separate = [(int(intent), re.compile("|".join(patterns)).match) for intent, patterns in categories]
+    # Быстрый отсев позиций по первой букве ключевых слов: без него re пробует
+    # все альтернативы в каждой позиции текста
+    first_chars = {p[2] for p in GOODBYE_KEYWORDS}  # шаблоны прощания начинаются с \b
+    first_chars.update(kw[0] for kw in PRICE_KEYWORDS + REFUSAL_KEYWORDS + SUCCESS_KEYWORDS)
+    first_class = "[" + "".join(re.escape(ch) for ch in sorted(first_chars)) + "]"
+    return re.compile(f"(?={first_class})(?:" + "|".join(groups) + ")"), separate
+
+
+_PATTERN, _CATEGORY_MATCHERS = _build_pattern()
+# Внутри цикла — обычные int: операции над IntFlag заметно дороже
+_GROUP_BITS = {intent.name: int(intent) for intent in Intent if intent}
+_ALL_BITS = int(Intent.GOODBYE | Intent.PRICE | Intent.REFUSAL | Intent.SUCCESS)
+
+
+def classify(text: str) -> Intent:
+    """Все категории ключевых слов в тексте одним проходом, в виде набора флагов."""
+    low = text.lower()
+    search = _PATTERN.search
+    found = 0
+    match = search(low)
+    while match is not None:
+        start = match.start()
+        found |= _GROUP_BITS[match.lastgroup]
+        for bit, category_match in _CATEGORY_MATCHERS:
+            if not found & bit and category_match(low, start):
+                found |= bit
+        if found == _ALL_BITS:
+            break
+        match = search(low, start + 1)
+    return Intent(found)
+
+
+def _legacy_helpers():
+    """Прежние отдельные проверки — эталон для бенчмарка и сверки результатов."""
+    def is_goodbye(text):
+        txt_lower = text.lower()
+        return any(re.search(pattern, txt_lower) for pattern in GOODBYE_KEYWORDS)
+
+    def is_price_inquiry(text):
+        return "скільки коштує" in text.lower()
+
+    def is_refusal(text):
+        low = text.lower()
+        return any(kw in low for kw in REFUSAL_KEYWORDS)
+
+    def check_success(text):
+        text = text.lower()
+        return any(kw in text for kw in SUCCESS_KEYWORDS)
+
+    def legacy_classify(text):
+        return (
+            is_goodbye(text) * 1
+            | is_price_inquiry(text) * 2
+            | is_refusal(text) * 4
+            | check_success(text) * 8
+        )
+
+    return legacy_classify
+
+
+def benchmark(replies, repeat=3):
+    """Возвращает (секунды старых проверок, секунды classify) на корпусе replies."""
+    legacy_classify = _legacy_helpers()
+    mismatches = sum(1 for r in replies if legacy_classify(r) != int(classify(r)))
+    if mismatches:
+        raise AssertionError(f"classify розходиться зі старими перевірками у {mismatches} репліках")
+
+    def best(func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for reply in replies:
+                func(reply)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    return best(legacy_classify), best(classify)
+
+
+def load_reply_corpus(multiplier=1):
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+    replies = []
+    for name in ("dialogues.json", "refined_dialogues.json"):
+        path = os.path.join(data_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for dlg in json.load(f):
+                replies.extend(turn["message"] for turn in dlg["dialogue"])
+    return replies * multiplier
+
+
+if __name__ == "__main__":
+    multiplier = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    corpus = load_reply_corpus(multiplier)
+    legacy_time, new_time = benchmark(corpus)
+    print(f"Реплік: {len(corpus)}")
+    print(f"Окремі перевірки: {legacy_time:.3f} с")
+    print(f"classify:          {new_time:.3f} с ({legacy_time / new_time:.1f}x)")
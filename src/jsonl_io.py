@@ -0,0 +1,155 @@
+import os
+import json
+import gzip
+
+# Через сколько записей делать fsync: компромисс между скоростью и потерями при сбое
+FSYNC_EVERY = int(os.getenv("JSONL_FSYNC_EVERY", "50"))
+
+
+def _open_text(file_path, mode):
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, mode + "t", encoding="utf-8")
+    return open(file_path, mode, encoding="utf-8")
+
+
+class JsonlWriter:
+    """
+    Потоковая запись JSONL: одна запись — одна строка, flush после каждой записи,
+    fsync пачками по fsync_every. Файлы с суффиксом .gz пишутся в gzip
+    (в режиме "a" добавляется новый gzip-член, что gzip читает прозрачно).
+    """
+
+    def __init__(self, file_path, mode="w", fsync_every=FSYNC_EVERY):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file_path = file_path
+        self.fsync_every = max(1, fsync_every)
+        self.count = 0
+        self._file = _open_text(file_path, mode)
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+        if self.count % self.fsync_every == 0:
+            self._fsync()
+
+    def _fsync(self):
+        try:
+            os.fsync(self._file.fileno())
+        except OSError:
+            pass
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.flush()
+        self._fsync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_jsonl(file_path):
+    """Читает JSONL построчно; оборванная последняя строка (сбой при записи) пропускается."""
+    with _open_text(file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ Пропущено пошкоджений рядок у {file_path}")
+
+
+def iter_records(file_path):
+    """
+    Единый читатель для стадий и ноутбуков: JSONL (.jsonl, .jsonl.gz) и старые
+    .json-массивы читаются потоково.
+    """
+    if file_path.endswith(".json"):
+        yield from iter_json_array(file_path)
+    else:
+        yield from iter_jsonl(file_path)
+
+
+def iter_json_array(file_path, chunk_size=1 << 16):
+    """
+    Потоковое чтение JSON-массива (persons.json, prompts.json): элементы
+    разбираются по мере чтения кусками chunk_size, память не растёт с размером файла.
+    """
+    decoder = json.JSONDecoder()
+    with _open_text(file_path, "r") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+
+        def skip(chars):
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        fill()
+        skip(" \t\r\n")
+        if pos == len(buf):
+            return
+        if buf[pos] != "[":
+            raise ValueError(f"{file_path}: очікувався JSON-масив")
+        pos += 1
+        while True:
+            skip(" \t\r\n,")
+            if pos == len(buf):
+                raise ValueError(f"{file_path}: масив обірвано")
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # Число на границе куска может быть неполным — дочитываем
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            pos = end
+            yield item
+
+
+def write_json_array(records, file_path, indent=4):
+    """
+    Пишет записи в JSON-массив по одной, байт в байт как json.dump(list(records),
+    ensure_ascii=False, indent=indent), но без списка в памяти. Возвращает число записей.
+    """
+    pad = " " * indent
+    # Плоский словарь (промпт) кодируется одним вызовом C-кодировщика: отступы
+    # заданы разделителями. json.dumps(indent=...) работает на чистом Python
+    flat_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",\n" + pad * 2, ": "))
+    count = 0
+    with _open_text(file_path, "w") as f:
+        for record in records:
+            if record and isinstance(record, dict) and not any(
+                    isinstance(value, (dict, list, tuple)) for value in record.values()):
+                body = flat_encoder.encode(record)
+                text = "{\n" + pad * 2 + body[1:-1] + "\n" + pad + "}"
+            else:
+                text = json.dumps(record, ensure_ascii=False, indent=indent).replace("\n", "\n" + pad)
+            f.write(("[\n" if count == 0 else ",\n") + pad + text)
+            count += 1
+        f.write("\n]" if count else "[]")
+    return count
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import contextlib
+
+# Нагрузочный прогон работает без сети и не должен ни читать, ни засорять кеш
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ["GPT_CACHE_MODE"] = "bypass"
+
+import gpt_client
+from fake_llm import FakeChatCompletion
+from generate_dialogues import (
+    load_prompts,
+    load_file,
+    generate_all_dialogues,
+    PROMPTS_FILE,
+    BOT_PROMPT_FILE
+)
+
+DEFAULT_NUM_DIALOGUES = 200
+WORKER_COUNTS = [1, 4, 16, 64]
+
+
+def run_load_test(num_dialogues, workers, latency=0.0, error_rate=0.0):
+    """
+    Прогоняет num_dialogues диалогов через фейковый бекенд и возвращает
+    (секунды, число вызовов LLM, число успешных диалогов).
+    """
+    prompts = load_prompts(PROMPTS_FILE)
+    bot_prompt = load_file(BOT_PROMPT_FILE)
+    if not prompts or not bot_prompt:
+        raise RuntimeError("Немає промптів або bot_prompt.txt")
+
+    backend = FakeChatCompletion(latency=latency, error_rate=error_rate)
+    gpt_client.set_backend(backend.create)
+    # Повторы после фейковых 429/503 не должны искажать замер задержками
+    gpt_client.BACKOFF_BASE = 0.0
+
+    items = (prompts[i % len(prompts)] for i in range(num_dialogues))
+    success_count = 0
+    start = time.perf_counter()
+    for _, success in generate_all_dialogues(items, bot_prompt, workers):
+        success_count += success
+    return time.perf_counter() - start, backend.calls, success_count
+
+
+def main():
+    num_dialogues = DEFAULT_NUM_DIALOGUES
+    if len(sys.argv) > 1:
+        try:
+            num_dialogues = int(sys.argv[1])
+        except ValueError:
+            print(f"Невірний аргумент, використовується значення за замовчуванням: {DEFAULT_NUM_DIALOGUES}")
+    latency = float(os.getenv("FAKE_LLM_LATENCY", "0.05"))
+    error_rate = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+    results = []
+    for workers in WORKER_COUNTS:
+        # Журнал отдельных диалогов в нагрузочном прогоне не нужен
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            elapsed, calls, success_count = run_load_test(num_dialogues, workers, latency, error_rate)
+        results.append((workers, elapsed, calls, success_count))
+
+    print(f"\n📊 {num_dialogues} діалогів, затримка {latency} с, помилки {error_rate:.0%}")
+    for workers, elapsed, calls, success_count in results:
+        print(
+            f"  потоків {workers:>3}: {elapsed:7.2f} с, "
+            f"{num_dialogues / elapsed:8.1f} діал./с, {calls} викликів LLM, успішних {success_count}"
+        )
+
+
+if __name__ == "__main__":
+    main()
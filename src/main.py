@@ -1,49 +1,47 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import subprocess
-import sys
-import os
+from pipeline import run_pipeline
 
 GLOBAL_EXAMPLES_LIMIT = 5
 RUN_REFINE_DIALOGUES = False  # Переключатель для улучшателя диалогов
+RESUME_RUN = True  # Продолжить прерванный прогон по data/run_manifest.jsonl; False — начать заново
+WRITE_INTERMEDIATE = True  # Сохранять персоны и промпты (persons.jsonl, prompts.jsonl, refined_prompts.jsonl)
+DEDUP_DIALOGUES = False  # Кластеры почти-копий (dialogue_clusters.jsonl); с улучшателем копии не улучшаются
+DIALOGUE_STORE = False  # Индексированное хранилище dialogues.store для поиска по conversation_id и атрибутам
+EXPORT_PARQUET = False  # Таблицы реплик и диалогов в Parquet для анализа (нужен pyarrow)
 
 def main():
     """
-    Запускает файлы:
-      1) generate_persons.py
-      2) generate_prompts.py
-      3) refine_prompts.py
-      4) generate_dialogues.py
-      5) refine_dialogues.py (опционально)
-
-    Каждый файл получает GLOBAL_EXAMPLES_LIMIT в качестве аргумента.
-    При запуске файла напрямую используется локальная константа.
+    Запускает в одном процессе стадии:
+      1) generate_persons
+      2) generate_prompts
+      3) refine_prompts
+      4) generate_dialogues
+      5) dedup — поиск почти-копий, перед refine_dialogues они отбрасываются (опционально)
+      6) refine_dialogues (опционально)
+      7) dialogue_store — индексированное хранилище диалогов (опционально)
+      8) export_dataset — Parquet-таблицы для ноутбуков (опционально)
+
+    Стадии передают данные друг другу генераторами, без промежуточного
+    перезапуска интерпретатора; GLOBAL_EXAMPLES_LIMIT задаёт число персон.
+    При запуске файла стадии напрямую используется его локальная константа.
+
+    При RESUME_RUN завершённые стадии читаются из своих файлов, а незавершённая
+    продолжается с того элемента, на котором оборвалась.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-
-    scripts = [
-        "generate_persons.py",
-        "generate_prompts.py",
-        "refine_prompts.py",
-        "generate_dialogues.py"
-    ]
-
-    if RUN_REFINE_DIALOGUES:
-        scripts.append("refine_dialogues.py")
-
-    for script in scripts:
-        script_path = os.path.join(script_dir, script)
-        if not os.path.exists(script_path):
-            print(f"❌ Не найден файл {script}")
-            return
-        print(f"\n=== Запуск {script} с ограничением {GLOBAL_EXAMPLES_LIMIT} ===")
-        ret = subprocess.run([sys.executable, script_path, str(GLOBAL_EXAMPLES_LIMIT)])
-        if ret.returncode != 0:
-            print(f"❌ Ошибка выполнения {script}. Код {ret.returncode}")
-            return
-        print(f"✅ {script} выполнен успешно.\n")
-    
+    stats = run_pipeline(
+        GLOBAL_EXAMPLES_LIMIT,
+        refine_dialogues=RUN_REFINE_DIALOGUES,
+        write_intermediate=WRITE_INTERMEDIATE,
+        resume=RESUME_RUN,
+        export_parquet=EXPORT_PARQUET,
+        dialogue_store=DIALOGUE_STORE,
+        dedup=DEDUP_DIALOGUES
+    )
+    if stats is None:
+        print("❌ Конвеєр зупинено.")
+        return
     print("Все шаги завершены!")
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+from bisect import bisect_left
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+METRICS_FILE = os.path.join(DATA_DIR, "metrics.json")
+# Prometheus text exposition пишется, только если задан путь
+PROMETHEUS_FILE = os.getenv("METRICS_PROM_FILE", "")
+
+# Границы корзин гистограммы задержек, секунды
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+_COUNTERS = ("calls", "cache_hits", "retries", "errors", "prompt_tokens", "completion_tokens")
+
+
+class StageMetrics:
+    def __init__(self):
+        self.counters = dict.fromkeys(_COUNTERS, 0)
+        self.errors_by_type = {}
+        # Последняя корзина — всё, что дольше LATENCY_BUCKETS[-1]
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    def observe_latency(self, seconds):
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        self.latency_count += 1
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q."""
+        if not self.latency_count:
+            return 0.0
+        rank = q * self.latency_count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self):
+        result = dict(self.counters)
+        result["errors_by_type"] = dict(self.errors_by_type)
+        result["latency"] = {
+            "count": self.latency_count,
+            "sum_seconds": round(self.latency_sum, 3),
+            "mean_seconds": round(self.latency_sum / self.latency_count, 3) if self.latency_count else 0.0,
+            "p50_le_seconds": self.quantile(0.5),
+            "p95_le_seconds": self.quantile(0.95),
+            "buckets": {
+                str(bound): count
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), self.bucket_counts)
+            }
+        }
+        return result
+
+
+_lock = threading.Lock()
+_stages = {}
+
+
+def _stage(stage):
+    metrics = _stages.get(stage)
+    if metrics is None:
+        metrics = _stages[stage] = StageMetrics()
+    return metrics
+
+
+def record_call(stage, latency, response=None):
+    """Успешный вызов API: задержка и usage ответа."""
+    usage = response.get("usage") if response else None
+    with _lock:
+        metrics = _stage(stage)
+        metrics.counters["calls"] += 1
+        metrics.observe_latency(latency)
+        if usage:
+            metrics.counters["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            metrics.counters["completion_tokens"] += usage.get("completion_tokens", 0)
+
+
+def record_cache_hit(stage):
+    with _lock:
+        _stage(stage).counters["cache_hits"] += 1
+
+
+def record_retry(stage):
+    with _lock:
+        _stage(stage).counters["retries"] += 1
+
+
+def record_error(stage, error, latency=None):
+    """Неудачная попытка вызова (в том числе та, что потом будет повторена)."""
+    name = type(error).__name__
+    with _lock:
+        metrics = _stage(stage)
+        metrics.counters["errors"] += 1
+        metrics.errors_by_type[name] = metrics.errors_by_type.get(name, 0) + 1
+        if latency is not None:
+            metrics.observe_latency(latency)
+
+
+def snapshot():
+    with _lock:
+        return {stage: metrics.summary() for stage, metrics in sorted(_stages.items())}
+
+
+def prometheus_text():
+    lines = [
+        "# HELP llm_requests_total ChatCompletion calls by stage and outcome.",
+        "# TYPE llm_requests_total counter",
+    ]
+    with _lock:
+        stages = sorted(_stages.items())
+        for stage, m in stages:
+            lines.append(f'llm_requests_total{{stage="{stage}",outcome="ok"}} {m.counters["calls"]}')
+            lines.append(f'llm_requests_total{{stage="{stage}",outcome="cache_hit"}} {m.counters["cache_hits"]}')
+            lines.append(f'llm_requests_total{{stage="{stage}",outcome="error"}} {m.counters["errors"]}')
+        lines += ["# HELP llm_retries_total Retried ChatCompletion attempts.", "# TYPE llm_retries_total counter"]
+        for stage, m in stages:
+            lines.append(f'llm_retries_total{{stage="{stage}"}} {m.counters["retries"]}')
+        lines += ["# HELP llm_tokens_total Tokens reported in response usage.", "# TYPE llm_tokens_total counter"]
+        for stage, m in stages:
+            lines.append(f'llm_tokens_total{{stage="{stage}",kind="prompt"}} {m.counters["prompt_tokens"]}')
+            lines.append(f'llm_tokens_total{{stage="{stage}",kind="completion"}} {m.counters["completion_tokens"]}')
+        lines += ["# HELP llm_request_latency_seconds ChatCompletion call latency.",
+                  "# TYPE llm_request_latency_seconds histogram"]
+        for stage, m in stages:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), m.bucket_counts):
+                cumulative += count
+                lines.append(f'llm_request_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'llm_request_latency_seconds_sum{{stage="{stage}"}} {m.latency_sum:.6f}')
+            lines.append(f'llm_request_latency_seconds_count{{stage="{stage}"}} {m.latency_count}')
+    return "\n".join(lines) + "\n"
+
+
+def export_metrics(json_file=METRICS_FILE, prometheus_file=PROMETHEUS_FILE):
+    """Сохраняет сводку по стадиям этого процесса в JSON и, если задано, в формате Prometheus."""
+    summary = snapshot()
+    if not summary:
+        return
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4)
+    if prometheus_file:
+        with open(prometheus_file, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+    for stage, data in summary.items():
+        print(
+            f"📈 [{stage}] викликів {data['calls']}, з кешу {data['cache_hits']}, "
+            f"повторів {data['retries']}, помилок {data['errors']}, "
+            f"токенів {data['prompt_tokens']}+{data['completion_tokens']}, "
+            f"p50 ≤ {data['latency']['p50_le_seconds']} с, p95 ≤ {data['latency']['p95_le_seconds']} с"
+        )
+    print(f"📈 Метрики збережено у {json_file}" + (f" та {prometheus_file}" if prometheus_file else ""))
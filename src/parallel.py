@@ -0,0 +1,28 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+
+def ordered_imap(func, iterable, max_workers, window=None):
+    """
+    Ленивый map через пул потоков. Результаты отдаются строго в порядке входа,
+    одновременно в работе не больше window элементов (по умолчанию 2 * max_workers),
+    поэтому вход может быть генератором любой длины.
+    """
+    if max_workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    window = window or max_workers * 2
+    items = iter(iterable)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = deque(pool.submit(func, item) for item in islice(items, window))
+        while pending:
+            result = pending.popleft().result()
+            for item in islice(items, 1):
+                pending.append(pool.submit(func, item))
+            yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+from array import array
+from collections import defaultdict
+
+from jsonl_io import iter_records
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+
+# Порядок полей персоны — как в generate_persons.generate_person
+FIELDS = (
+    "name", "age", "gender", "hobbies", "profession", "character", "values", "marital_status",
+    "political_views", "interest", "tone", "mood", "phone", "city", "country", "children"
+)
+# Значения из небольших словарей: в столбце код (uint16), строки — по разу на столбец
+CATEGORY_FIELDS = (
+    "name", "gender", "hobbies", "profession", "character", "values", "marital_status",
+    "political_views", "city", "country"
+)
+# Небольшие целые; MISSING — поля у персоны нет
+INT_FIELDS = ("age", "interest", "tone", "mood")
+MISSING = -1
+
+
+class _Categories:
+    """Словарь значений столбца: код — номер значения в порядке появления."""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def person_id_of(record):
+    """Номер персоны записи промпта или диалога; у старых диалогов это prompt_index."""
+    person_id = record.get("person_id")
+    return record.get("prompt_index") if person_id is None else person_id
+
+
+class PersonaStore:
+    """
+    Персоны по столбцам: перечисления — коды в array('H'), возраст и уровни —
+    array('h'), дети — общие столбцы имён и возрастов со смещениями по персонам.
+    Номер персоны (person_id) — порядковый номер добавления, он же номер в прогоне,
+    поэтому промпты и диалоги ссылаются на персону числом.
+    """
+
+    def __init__(self):
+        self._categories = {name: _Categories() for name in CATEGORY_FIELDS}
+        self._codes = {name: array("H") for name in CATEGORY_FIELDS}
+        self._ints = {name: array("h") for name in INT_FIELDS}
+        self._phones = []
+        self._child_names = _Categories()
+        self._child_name_codes = array("H")
+        self._child_ages = array("h")
+        self._child_offsets = array("I", [0])
+        # Поля, которых нет в FIELDS (редкость): по словарю на персону или None
+        self._extra = []
+
+    def add(self, person):
+        """Добавляет персону и возвращает её person_id."""
+        person_id = len(self._phones)
+        for name in CATEGORY_FIELDS:
+            self._codes[name].append(self._categories[name].code(person.get(name)))
+        for name in INT_FIELDS:
+            value = person.get(name)
+            self._ints[name].append(MISSING if value is None else value)
+        self._phones.append(person.get("phone"))
+        for child in person.get("children") or ():
+            self._child_name_codes.append(self._child_names.code(child["name"]))
+            self._child_ages.append(child["age"])
+        self._child_offsets.append(len(self._child_ages))
+        extra = {key: value for key, value in person.items() if key not in FIELDS}
+        self._extra.append(extra or None)
+        return person_id
+
+    def __len__(self):
+        return len(self._phones)
+
+    def __getitem__(self, person_id):
+        """Персона как словарь, в том же виде, в каком её записал generate_persons."""
+        person = {}
+        for name in FIELDS:
+            value = self._value(name, person_id)
+            if value is not None:
+                person[name] = value
+        if self._extra[person_id]:
+            person.update(self._extra[person_id])
+        return person
+
+    def get(self, person_id, default=None):
+        if person_id is None or not 0 <= person_id < len(self):
+            return default
+        return self[person_id]
+
+    def _value(self, name, person_id):
+        if name in self._codes:
+            return self._categories[name].values[self._codes[name][person_id]]
+        if name in self._ints:
+            value = self._ints[name][person_id]
+            return None if value == MISSING else value
+        if name == "phone":
+            return self._phones[person_id]
+        start, end = self._child_offsets[person_id], self._child_offsets[person_id + 1]
+        return [
+            {"name": self._child_names.values[code], "age": age}
+            for code, age in zip(self._child_name_codes[start:end], self._child_ages[start:end])
+        ]
+
+    def column(self, name):
+        """Значения поля по всем персонам (индекс — person_id); для num_children — число детей."""
+        if name in self._codes:
+            values = self._categories[name].values
+            return [values[code] for code in self._codes[name]]
+        if name in self._ints:
+            return [None if value == MISSING else value for value in self._ints[name]]
+        if name == "num_children":
+            offsets = self._child_offsets
+            return [offsets[i + 1] - offsets[i] for i in range(len(self))]
+        return [self._value(name, i) for i in range(len(self))]
+
+    def where(self, **criteria):
+        """person_id персон, у которых все поля равны заданным, например where(interest=9, city="Київ")."""
+        ids = range(len(self))
+        for name, value in criteria.items():
+            if name in self._codes:
+                code = self._categories[name].codes.get(value)
+                if code is None:
+                    return []
+                column = self._codes[name]
+                ids = [i for i in ids if column[i] == code]
+            elif name in self._ints:
+                column = self._ints[name]
+                ids = [i for i in ids if column[i] == value]
+            else:
+                column = self.column(name)
+                ids = [i for i in ids if column[i] == value]
+        return list(ids)
+
+
+def load_persona_store(file_path):
+    """
+    Персоны из файла, к которому относятся person_id промптов и диалогов.
+    Без файла — пустое хранилище и предупреждение: персоны других прогонов не подставляются.
+    """
+    store = PersonaStore()
+    if not os.path.exists(file_path):
+        print(f"⚠️ Файл персон {file_path} не знайдено: поля персон не підставляються")
+        return store
+    for person in iter_records(file_path):
+        store.add(person)
+    return store
+
+
+def persons_path(record, default=None):
+    """Путь к файлу персон записи промпта или диалога (поле persons_file), иначе default."""
+    persons_file = record.get("persons_file")
+    return os.path.join(DATA_DIR, persons_file) if persons_file else default
+
+
+class PersonaLookup:
+    """
+    Персона записи по её persons_file и person_id; хранилище каждого файла
+    загружается один раз. stores — уже заполненные хранилища по путям.
+    Записи без persons_file (старые файлы) без default_file остаются без персоны.
+    """
+
+    def __init__(self, default_file=None, stores=None):
+        self.default_file = default_file
+        self._stores = {os.path.abspath(path): store for path, store in (stores or {}).items()}
+        self.unlinked = 0
+
+    def store_for(self, record):
+        path = persons_path(record, self.default_file)
+        if path is None:
+            if not self.unlinked:
+                print("⚠️ Записи без persons_file: поля персон для них не підставляються")
+            self.unlinked += 1
+            return None
+        path = os.path.abspath(path)
+        if path not in self._stores:
+            self._stores[path] = load_persona_store(path)
+        return self._stores[path]
+
+    def get(self, record):
+        store = self.store_for(record)
+        return store.get(person_id_of(record)) if store is not None else None
+
+
+def success_rate_by(lookup, records, *fields):
+    """
+    Итоги диалогов по сочетаниям полей персоны: {(значения полей): (успешных, всего)},
+    например success_rate_by(PersonaLookup(), dialogues, "interest", "city").
+    """
+    columns = {}
+    totals = defaultdict(lambda: [0, 0])
+    for record in records:
+        store = lookup.store_for(record)
+        person_id = person_id_of(record)
+        if store is None or person_id is None or not 0 <= person_id < len(store):
+            continue
+        if id(store) not in columns:
+            columns[id(store)] = [store.column(name) for name in fields]
+        total = totals[tuple(column[person_id] for column in columns[id(store)])]
+        total[0] += bool(record.get("success"))
+        total[1] += 1
+    return {key: tuple(total) for key, total in totals.items()}
+
+
+if __name__ == "__main__":
+    from dialogue_store import open_dialogues, DIALOGUES_FILE
+
+    args = sys.argv[1:]
+    input_file = args.pop(0) if args and args[0].endswith((".jsonl", ".json", ".gz")) else DIALOGUES_FILE
+    rates = success_rate_by(PersonaLookup(), open_dialogues(input_file), *(args or ["interest"]))
+    for key, (success, total) in sorted(rates.items(), key=lambda item: str(item[0])):
+        print(f"{' / '.join(map(str, key))}: {success}/{total} ({success / total:.0%})")
@@ -0,0 +1,226 @@
+import os
+from collections import Counter
+
+from jsonl_io import JsonlWriter, iter_jsonl
+from parallel import ordered_imap
+from response_cache import report_cache_stats
+from metrics import export_metrics
+from context_window import new_usage, add_usage, format_usage
+from run_manifest import RunManifest, item_id, reset_manifest
+from dialogue_store import build_store
+from dedup import dedup_stage
+from seeding import get_run_seed, set_run_seed
+from early_stop import new_savings, add_savings, format_savings, EARLY_STOP
+from slot_responder import SLOT_RESPONDER
+from persona_store import PersonaStore, PersonaLookup, load_persona_store
+from generate_persons import iter_persons
+from generate_prompts import iter_prompts
+from refine_prompts import refine_prompt
+from generate_dialogues import (
+    create_dialogue,
+    load_file,
+    BOT_PROMPT_FILE,
+    DIALOGUES_FILE,
+    MAX_WORKERS
+)
+from refine_dialogues import (
+    refine_dialogue,
+    load_prompt,
+    format_status_counts,
+    OUTPUT_FILE as REFINED_DIALOGUES_FILE
+)
+from refine_prompts import OUTPUT_FILE as REFINED_PROMPTS_FILE
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+PERSONS_FILE = os.path.join(DATA_DIR, "persons.jsonl")
+PROMPTS_FILE = os.path.join(DATA_DIR, "prompts.jsonl")
+
+
+def _stage_saved(manifest, stage, file_path):
+    """Стадия завершена в этом прогоне, и её результат читается из файла."""
+    return manifest.is_stage_done(stage) and os.path.exists(file_path)
+
+
+def _stage(manifest, stage, file_path, produce, write):
+    """
+    Источник данных стадии. Если стадия уже завершена в этом прогоне и её файл
+    сохранён, данные читаются из файла; иначе генерируются и (при write) пишутся по ходу.
+    """
+    if _stage_saved(manifest, stage, file_path):
+        print(f"⏭ [{stage}] вже виконано, читаємо {file_path}")
+        yield from iter_jsonl(file_path)
+        return
+
+    if write:
+        with JsonlWriter(file_path) as writer:
+            for item in produce():
+                writer.write(item)
+                yield item
+    else:
+        yield from produce()
+    manifest.mark_stage_done(stage)
+
+
+def _remember(persons, store):
+    """Пропускает персоны дальше, добавляя их в store (person_id — номер по порядку)."""
+    for person in persons:
+        store.add(person)
+        yield person
+
+
+def _saved_prefix(file_path, resumed):
+    """Уже сохранённые записи прерванного прогона (до начала дописывания)."""
+    if not resumed or not os.path.exists(file_path):
+        return []
+    saved = sum(1 for _ in iter_jsonl(file_path))
+    return (record for _, record in zip(range(saved), iter_jsonl(file_path)))
+
+
+def dialogue_stage(manifest, prompts, bot_prompt, max_workers=MAX_WORKERS, stats=None, persons=None):
+    """
+    Генерирует диалоги по мере поступления промптов. Уже готовые (по манифесту)
+    промпты не перегенерируются, а их диалоги отдаются дальше из dialogues.jsonl.
+    persons — PersonaStore прогона; персона диалога ищется по person_id промпта.
+    """
+    stage = "dialogues"
+    seed = get_run_seed()
+    resumed = manifest.completed_count(stage) > 0
+    yield from _saved_prefix(DIALOGUES_FILE, resumed)
+
+    def pending():
+        for i, prompt in enumerate(prompts):
+            iid = item_id(i, prompt["text"])
+            if not manifest.is_done(stage, iid):
+                yield iid, i, prompt
+
+    def run(item):
+        iid, index, prompt = item
+        print(f"\n🛠 Генерується діалог для '{prompt['id']}'...\n")
+        person = persons.get(prompt.get("person_id", index)) if persons is not None else None
+        return iid, create_dialogue(prompt, bot_prompt, index, seed, person=person)
+
+    with JsonlWriter(DIALOGUES_FILE, "a" if resumed else "w") as writer:
+        for iid, (d, success) in ordered_imap(run, pending(), max_workers):
+            writer.write(d)
+            manifest.mark_done(stage, iid)
+            if stats is not None:
+                stats["dialogues"] = stats.get("dialogues", 0) + 1
+                stats["success"] = stats.get("success", 0) + int(success)
+                add_usage(stats.setdefault("usage", new_usage()), d["usage"])
+                add_savings(stats.setdefault("early_stop", new_savings()), d.get("early_stop"))
+                stats["local_answers"] = stats.get("local_answers", 0) + d.get("local_answers", 0)
+            yield d
+    manifest.mark_stage_done(stage)
+
+
+def refine_dialogue_stage(manifest, dialogues, max_workers=MAX_WORKERS, stats=None):
+    stage = "refine_dialogues"
+    resumed = manifest.completed_count(stage) > 0
+    system_prompt = load_prompt()
+
+    def pending():
+        for i, dlg in enumerate(dialogues):
+            if not manifest.is_done(stage, dlg.get("conversation_id", f"dialogue_{i}")):
+                yield i, dlg
+
+    def run(item):
+        i, dlg = item
+        return refine_dialogue(dlg, system_prompt, i)
+
+    with JsonlWriter(REFINED_DIALOGUES_FILE, "a" if resumed else "w") as writer:
+        for record in ordered_imap(run, pending(), max_workers):
+            writer.write(record)
+            manifest.mark_done(stage, record["conversation_id"])
+            if stats is not None:
+                stats.setdefault("refine_status", Counter())[record["refine_status"]] += 1
+            yield record
+    manifest.mark_stage_done(stage)
+
+
+def run_pipeline(count, refine_dialogues=False, write_intermediate=True,
+                 max_workers=MAX_WORKERS, resume=True, export_parquet=False,
+                 dialogue_store=False, dedup=False):
+    """
+    Весь конвейер в одном процессе: персоны → промпты → улучшенные промпты →
+    диалоги → (опционально) улучшенные диалоги. Стадии — генераторы, поэтому
+    диалоги начинают генерироваться, пока следующие промпты ещё строятся.
+    write_intermediate=False не пишет персоны и промпты на диск.
+    """
+    if not resume:
+        reset_manifest()
+    manifest = RunManifest()
+    # Персоны, промпты и conversation_id выводятся из сида, поэтому возобновлённый
+    # прогон должен продолжить с тем же сидом
+    if manifest.seed is not None:
+        set_run_seed(manifest.seed)
+    manifest.set_seed(get_run_seed())
+    bot_prompt = load_file(BOT_PROMPT_FILE)
+    if not bot_prompt:
+        print("❌ Немає даних!")
+        return None
+
+    persons = _stage(manifest, "persons", PERSONS_FILE,
+                     lambda: iter_persons(count), write_intermediate)
+    if (_stage_saved(manifest, "prompts", PROMPTS_FILE)
+            or _stage_saved(manifest, "refine_prompts", REFINED_PROMPTS_FILE)):
+        # Промпты читаются из файла, и генератор персон не проходится: персоны
+        # для диалогов берутся из сохранённого файла, как в непрерванном прогоне
+        known_persons = load_persona_store(PERSONS_FILE)
+    else:
+        # Персона i попадает в хранилище раньше, чем из неё строится промпт i
+        known_persons = PersonaStore()
+        persons = _remember(persons, known_persons)
+    prompts = _stage(manifest, "prompts", PROMPTS_FILE,
+                     lambda: iter_prompts(persons, persons_file=os.path.basename(PERSONS_FILE)),
+                     write_intermediate)
+    refined_prompts = _stage(manifest, "refine_prompts", REFINED_PROMPTS_FILE,
+                             lambda: (refine_prompt(pr, i) for i, pr in enumerate(prompts)),
+                             write_intermediate)
+
+    stats = {"dialogues": 0, "success": 0, "usage": new_usage(), "early_stop": new_savings()}
+    output = dialogue_stage(manifest, refined_prompts, bot_prompt, max_workers, stats, known_persons)
+    if dedup:
+        # Почти-копии не отправляются на улучшение; без refine только размечаются кластерами
+        output = dedup_stage(output, drop=refine_dialogues)
+    if refine_dialogues:
+        output = refine_dialogue_stage(manifest, output, max_workers, stats)
+
+    try:
+        for _ in output:
+            pass
+    finally:
+        manifest.close()
+
+    print(f"\n🎲 RUN_SEED={get_run_seed()}")
+    print(f"Згенеровано нових діалогів: {stats['dialogues']}")
+    print(f"Успішних діалогів (запис на курс): {stats['success']}")
+    print(f"LLM у діалогах: {format_usage(stats['usage'])}")
+    if EARLY_STOP:
+        print(f"Рання зупинка: {format_savings(stats['early_stop'])}")
+    if SLOT_RESPONDER:
+        print(f"Відповідей на слоти без LLM: {stats.get('local_answers', 0)}")
+    if stats.get("refine_status"):
+        print(f"Покращення діалогів: {format_status_counts(stats['refine_status'])}")
+    report_cache_stats("refine_prompts")
+    report_cache_stats("dialogues")
+    if refine_dialogues:
+        report_cache_stats("refine_dialogues")
+    export_metrics()
+
+    # Персоны прогона уже в памяти (persons.jsonl может и не писаться)
+    lookup = PersonaLookup(stores={PERSONS_FILE: known_persons})
+    if dialogue_store:
+        build_store(DIALOGUES_FILE, persons=lookup)
+        if refine_dialogues:
+            build_store(REFINED_DIALOGUES_FILE, persons=lookup)
+
+    if export_parquet:
+        # pandas/pyarrow нужны только для экспорта
+        from export_dataset import export_dialogues
+        export_dialogues(DIALOGUES_FILE, lookup)
+        if refine_dialogues:
+            export_dialogues(REFINED_DIALOGUES_FILE, lookup)
+
+    # Прогон завершён целиком — следующий запуск начнётся с нуля
+    reset_manifest()
+    return stats
@@ -1,26 +1,57 @@
 import os
 import json
-import openai
 import re
-from dotenv import load_dotenv
+import sys
+from collections import Counter
+
+from gpt_client import chat_completion
+from response_cache import report_cache_stats
+from metrics import export_metrics
+from jsonl_io import JsonlWriter
+from dialogue_store import open_dialogues
+from dedup import dedup_stage
+from run_manifest import RunManifest, finish_stage
+from parallel import ordered_imap
+from batch_mode import batch_enabled, run_batch, response_text
 
 # Константа, управляющая улучшением диалогов:
 REFINE_DIALOGUES = True
+# Пропускать почти-копии (MinHash/LSH, см. dedup.py), чтобы не платить за их улучшение
+DROP_NEAR_DUPLICATES = False
+# Сколько диалогов улучшается одновременно (переопределяется REFINE_WORKERS)
+MAX_WORKERS = int(os.getenv("REFINE_WORKERS", "8"))
+# Сколько раз просить модель исправить невалидный JSON
+MAX_REPAIR_ATTEMPTS = 1
+
+# refined — улучшен с первого ответа, repaired — после исправления JSON,
+# skipped — не отправлялся (есть вызовы функций), invalid/error — оставлен исходный диалог
+REFINE_STATUSES = ("refined", "repaired", "skipped", "invalid", "error")
+
+JSON_MODE_INSTRUCTION = (
+    "\n\nФормат відповіді: JSON-об'єкт {\"dialogue\": [...]}, де кожна репліка — "
+    "об'єкт з рядковими полями \"role\" і \"message\", як у вхідному діалозі."
+)
+REPAIR_INSTRUCTION = (
+    "Відповідь не пройшла перевірку: {error}. Поверни лише виправлений "
+    "JSON-об'єкт {{\"dialogue\": [...]}} без пояснень."
+)
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
-INPUT_FILE = os.path.join(DATA_DIR, "dialogues.json")
-OUTPUT_FILE = os.path.join(DATA_DIR, "refined_dialogues.json")
+INPUT_FILE = os.path.join(DATA_DIR, "dialogues.jsonl")
+LEGACY_INPUT_FILE = os.path.join(DATA_DIR, "dialogues.json")
+OUTPUT_FILE = os.path.join(DATA_DIR, "refined_dialogues.jsonl")
 PROMPT_FILE = os.path.join(DATA_DIR, "refine_prompt.txt")
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 def load_dialogues():
-    if not os.path.exists(INPUT_FILE):
-        print(f"❌ Файл {INPUT_FILE} не знайдено!")
-        return []
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """
+    Потоково отдаёт диалоги: из dialogues.store, если оно собрано после
+    dialogues.jsonl, иначе из JSONL; если JSONL ещё нет — из старого dialogues.json.
+    """
+    for path in (INPUT_FILE, LEGACY_INPUT_FILE):
+        if os.path.exists(path):
+            return open_dialogues(path)
+    print(f"❌ Файл {INPUT_FILE} не знайдено!")
+    return iter(())
 
 def should_skip_dialogue(text: str) -> bool:
     return "function_call" in text or re.search(r'\{\s*"?function_call"?\s*:', text)
@@ -32,66 +63,210 @@ def load_prompt() -> str:
         return f.read().strip()
 
 def extract_json(text):
+    """JSON из ответа модели: весь текст или первый JSON-объект/массив в нём."""
+    text = (text or "").strip()
     try:
-        json_str = re.search(r'(\[.*\])', text, re.DOTALL).group(1)
-        return json.loads(json_str)
-    except (AttributeError, json.JSONDecodeError):
-        return None
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    decoder = json.JSONDecoder()
+    for start in (i for i, ch in enumerate(text) if ch in "[{"):
+        try:
+            return decoder.raw_decode(text, start)[0]
+        except json.JSONDecodeError:
+            continue
+    return None
+
+def validate_dialogue(data):
+    """
+    Возвращает (реплики, None) или (None, описание ошибки). Принимается объект
+    {"dialogue": [...]} JSON-режима и, для совместимости, голый массив реплик.
+    """
+    if isinstance(data, dict):
+        data = data.get("dialogue")
+    if not isinstance(data, list) or not data:
+        return None, "очікувався непорожній масив dialogue"
+    for i, turn in enumerate(data):
+        if not isinstance(turn, dict):
+            return None, f"репліка {i} не є об'єктом"
+        if not isinstance(turn.get("role"), str) or not isinstance(turn.get("message"), str):
+            return None, f"репліка {i} без рядкових полів role і message"
+    return data, None
 
-def refine_dialogue_with_gpt(dialogue: str, system_prompt: str) -> str:
+def refinement_messages(dialogue, system_prompt):
+    """Сообщения первого запроса или None, если диалог не отправляется на улучшение."""
     if not REFINE_DIALOGUES or should_skip_dialogue(dialogue):
-        return dialogue
+        return None
+    return [
+        {"role": "system", "content": system_prompt + JSON_MODE_INSTRUCTION},
+        {"role": "user", "content": dialogue}
+    ]
 
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": dialogue}
-            ],
-            max_tokens=1500,
-            temperature=0.7
-        )
+def refinement_request(messages):
+    return {
+        "model": "gpt-4o",
+        "messages": messages,
+        "max_tokens": 1500,
+        "temperature": 0.7,
+        "response_format": {"type": "json_object"}
+    }
+
+def check_refinement(messages, content, attempt):
+    """
+    Разбирает ответ попытки attempt. Возвращает (реплики, статус, None) для принятого
+    ответа или (None, "invalid", сообщения запроса на исправление).
+    """
+    refined, error = validate_dialogue(extract_json(content))
+    if refined is not None:
+        return refined, "repaired" if attempt else "refined", None
+    return None, "invalid", messages + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": REPAIR_INSTRUCTION.format(error=error)}
+    ]
 
-        refined = response["choices"][0]["message"]["content"].strip()
+def refine_dialogue_with_gpt(dialogue: str, system_prompt: str):
+    """
+    Возвращает (реплики или None, статус). Невалидный JSON исправляется не более
+    MAX_REPAIR_ATTEMPTS дополнительными запросами с описанием ошибки.
+    """
+    messages = refinement_messages(dialogue, system_prompt)
+    if messages is None:
+        return None, "skipped"
 
+    try:
+        for attempt in range(MAX_REPAIR_ATTEMPTS + 1):
+            response = chat_completion(stage="refine_dialogues", **refinement_request(messages))
+            refined, status, messages = check_refinement(messages, response_text(response), attempt)
+            if refined is not None:
+                return refined, status
     except Exception as e:
         print(f"❌ Помилка GPT: {e}")
-        refined = dialogue
+        return None, "error"
+    return None, "invalid"
 
-    return refined
+def dialogue_record(dlg, dialogue_id, refined, status):
+    if refined is None:
+        if status in ("invalid", "error"):
+            print(f"❌ Некоректний JSON, повертаємо вихідний діалог для {dialogue_id}")
+        refined = dlg["dialogue"]
+    record = {
+        "conversation_id": dialogue_id,
+        "dialogue": refined,
+        "refine_status": status
+    }
+    # Связь с персоной сохраняется и в улучшенных диалогах
+    for key in ("prompt_index", "person_id", "persons_file"):
+        if dlg.get(key) is not None:
+            record[key] = dlg[key]
+    return record
 
-def refine_dialogues():
-    dialogues = load_dialogues()
-    if not dialogues:
-        return
+def refine_dialogue(dlg, system_prompt, index=0):
+    dialogue_id = dlg.get("conversation_id", f"dialogue_{index}")
+    print(f"➡ Обробляється {index+1}: {dialogue_id}")
 
-    system_prompt = load_prompt()
+    dialogue_content = json.dumps(dlg["dialogue"], ensure_ascii=False, indent=2)
 
-    refined_dialogues = []
-    for i, dlg in enumerate(dialogues):
-        dialogue_id = dlg.get("conversation_id", f"dialogue_{i}")
-        print(f"➡ Обробляється {i+1}/{len(dialogues)}: {dialogue_id}")
+    refined_dialogue_json, status = refine_dialogue_with_gpt(dialogue_content, system_prompt)
 
-        dialogue_content = json.dumps(dlg["dialogue"], ensure_ascii=False, indent=2)
+    return dialogue_record(dlg, dialogue_id, refined_dialogue_json, status)
 
-        refined_content = refine_dialogue_with_gpt(dialogue_content, system_prompt)
+def refine_dialogues_in_batch(items, system_prompt):
+    """
+    Пакетный режим: первый раунд — все диалоги одним файлом Batch API, следующие
+    (не более MAX_REPAIR_ATTEMPTS) — только ответы с невалидным JSON.
+    items — пары (номер, диалог); отдаёт записи в том же порядке.
+    """
+    results = {}
+    conversations = {}
+    for i, dlg in items:
+        messages = refinement_messages(json.dumps(dlg["dialogue"], ensure_ascii=False, indent=2), system_prompt)
+        if messages is None:
+            results[i] = (None, "skipped")
+        else:
+            conversations[i] = messages
 
-        refined_dialogue_json = extract_json(refined_content)
+    for attempt in range(MAX_REPAIR_ATTEMPTS + 1):
+        if not conversations:
+            break
+        responses = run_batch(
+            "refine_dialogues",
+            [(f"dialogue-{i}", refinement_request(m)) for i, m in conversations.items()],
+            name=f"refine_dialogues_{attempt}"
+        )
+        repairs = {}
+        for i, messages in conversations.items():
+            response = responses.get(f"dialogue-{i}")
+            if response is None:
+                results[i] = (None, "error")
+                continue
+            refined, status, repair_messages = check_refinement(messages, response_text(response), attempt)
+            results[i] = (refined, status)
+            if refined is None:
+                repairs[i] = repair_messages
+        conversations = repairs
 
-        if refined_dialogue_json is None:
-            print(f"❌ Некоректний JSON, повертаємо вихідний діалог для {dialogue_id}")
-            refined_dialogue_json = dlg["dialogue"]
+    for i, dlg in items:
+        refined, status = results[i]
+        yield dialogue_record(dlg, dlg.get("conversation_id", f"dialogue_{i}"), refined, status)
 
-        refined_dialogues.append({
-            "conversation_id": dialogue_id,
-            "dialogue": refined_dialogue_json
-        })
+def format_status_counts(counts):
+    return ", ".join(f"{status}: {counts[status]}" for status in REFINE_STATUSES if counts[status])
+
+def refine_dialogues(max_workers=MAX_WORKERS):
+    dialogues = load_dialogues()
+    if DROP_NEAR_DUPLICATES:
+        dialogues = dedup_stage(dialogues, drop=True)
+    system_prompt = load_prompt()
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(refined_dialogues, f, ensure_ascii=False, indent=4)
+    # Диалоги читаются потоково, поэтому готовые отсеиваем по conversation_id на лету
+    manifest = RunManifest()
+    resumed = manifest.completed_count("refine_dialogues") > 0
+    skipped = 0
+    status_counts = Counter()
 
-    print(f"✅ Збережено {len(refined_dialogues)} покращених діалогів у {OUTPUT_FILE}!")
+    def pending():
+        nonlocal skipped
+        for i, dlg in enumerate(dialogues):
+            if manifest.is_done("refine_dialogues", dlg.get("conversation_id", f"dialogue_{i}")):
+                skipped += 1
+                continue
+            yield i, dlg
+
+    def run(item):
+        i, dlg = item
+        return refine_dialogue(dlg, system_prompt, i)
+
+    if batch_enabled():
+        records = refine_dialogues_in_batch(list(pending()), system_prompt)
+    else:
+        records = ordered_imap(run, pending(), max_workers)
+
+    with JsonlWriter(OUTPUT_FILE, "a" if resumed else "w") as writer:
+        for record in records:
+            writer.write(record)
+            manifest.mark_done("refine_dialogues", record["conversation_id"])
+            status_counts[record["refine_status"]] += 1
+
+    finish_stage(manifest, "refine_dialogues")
+    manifest.close()
+    if skipped:
+        print(f"⏭ [refine_dialogues] пропущено {skipped} вже готових діалогів")
+    if status_counts:
+        print(f"📋 Статуси: {format_status_counts(status_counts)}")
+
+    if not writer.count and not skipped:
+        print("❌ Немає діалогів для покращення.")
+        return
+    print(f"✅ Збережено {writer.count} покращених діалогів у {OUTPUT_FILE}!")
+    report_cache_stats("refine_dialogues")
+    export_metrics()
 
 if __name__ == "__main__":
-    refine_dialogues()
\ No newline at end of file
+    # Как в generate_dialogues: argv[1] у стадий — лимит элементов, потоки — argv[2]
+    workers = MAX_WORKERS
+    if len(sys.argv) > 2:
+        try:
+            workers = int(sys.argv[2])
+        except ValueError:
+            print(f"Невірна кількість потоків, використовується {MAX_WORKERS}")
+    refine_dialogues(workers)
\ No newline at end of file
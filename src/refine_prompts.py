@@ -1,6 +1,5 @@
 import os
 import json
-import openai
 import re
 
 # Константа, управляющая улучшением промптов:
@@ -8,11 +7,14 @@ REFINE_PROMPT = False  # Если False, пропускаем GPT-преобра
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
 INPUT_FILE = os.path.join(DATA_DIR, "prompts.json")
-OUTPUT_FILE = os.path.join(DATA_DIR, "refined_prompts.json")
+OUTPUT_FILE = os.path.join(DATA_DIR, "refined_prompts.jsonl")
 
-from dotenv import load_dotenv
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from gpt_client import chat_completion
+from response_cache import report_cache_stats
+from metrics import export_metrics
+from jsonl_io import JsonlWriter
+from run_manifest import RunManifest, item_id, split_pending, finish_stage
+from batch_mode import batch_enabled, run_batch, response_text
 
 
 def load_prompts():
@@ -82,22 +84,7 @@ def refine_prompt_logic(original_text: str) -> str:
     return "\n".join(new_lines)
 
 
-def refine_prompt_with_gpt(text: str) -> str:
-    """
-    Обработка GPT. Если REFINE_PROMPT=False — пропускаем.
-    """
-    # 1) Если REFINE_PROMPT=False, просто возвращаем исходный текст.
-    if not REFINE_PROMPT:
-        return text
-
-    # 2) Если текст «не подходит» для улучшения — возвращаем как есть.
-    if should_skip_improvement(text):
-        return text
-
-    # 3) Иначе пытаемся «улучшить».
-    force_ukr = not is_ukrainian_text(text)
-
-    system_prompt = """
+REFINE_SYSTEM_PROMPT = """
 Ти — коректор українською.
 Отримуєш технічний сценарій (не діалог!) про людину.
 1) Не змінюй факти (вік, кількість дітей, рівень зацікавленості).
@@ -107,51 +94,121 @@ def refine_prompt_with_gpt(text: str) -> str:
 5) Зроби стиль природнішим, без вигаданих фактів.
 """.strip()
 
+
+def build_refine_request(text: str):
+    """
+    Аргументы ChatCompletion для улучшения текста или None, если GPT-преобразование
+    не нужно (REFINE_PROMPT=False или служебный текст).
+    """
+    # 1) Если REFINE_PROMPT=False, просто возвращаем исходный текст.
+    if not REFINE_PROMPT:
+        return None
+
+    # 2) Если текст «не подходит» для улучшения — возвращаем как есть.
+    if should_skip_improvement(text):
+        return None
+
+    # 3) Иначе пытаемся «улучшить».
     user_text = text
-    if force_ukr:
+    if not is_ukrainian_text(text):
         user_text = f"Оригінальний текст:\n{text}\n\nПерепиши, будь ласка, українською."
 
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": REFINE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_text}
+        ],
+        "max_tokens": 1200,
+        "temperature": 0.7
+    }
+
+
+def refine_prompt_with_gpt(text: str) -> str:
+    """
+    Обработка GPT. Если REFINE_PROMPT=False — пропускаем.
+    """
+    request = build_refine_request(text)
+    if request is None:
+        return text
+
     try:
-        resp = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_text}
-            ],
-            max_tokens=1200,
-            temperature=0.7
-        )
-        refined = resp["choices"][0]["message"]["content"].strip()
-        return refined
+        resp = chat_completion(stage="refine_prompts", **request)
+        return response_text(resp)
     except Exception as e:
         print(f"❌ Помилка GPT: {e}")
         return text
 
 
-def refine_prompts():
-    prompts = load_prompts()
-    if not prompts:
-        return
+def prompt_record(pr, pid, text):
+    record = {"id": pid, "text": text}
+    for key in ("person_id", "persons_file"):
+        if pr.get(key) is not None:
+            record[key] = pr[key]
+    return record
 
-    refined_prompts = []
-    for i, pr in enumerate(prompts):
-        pid = pr.get("id", f"prompt_{i}")
-        original_text = pr.get("text", "")
-        print(f"➡ Обробляється {i+1}/{len(prompts)}: {pid}")
 
-        # 1) Применяем локальную логику вставок
-        logic_text = refine_prompt_logic(original_text)
+def refine_prompt(pr, index=0, total=0):
+    pid = pr.get("id", f"prompt_{index}")
+    original_text = pr.get("text", "")
+    print(f"➡ Обробляється {index+1}/{total or '?'}: {pid}")
+
+    # 1) Применяем локальную логику вставок
+    logic_text = refine_prompt_logic(original_text)
+
+    # 2) Применяем (или пропускаем) GPT-преобразование
+    final_text = refine_prompt_with_gpt(logic_text)
 
-        # 2) Применяем (или пропускаем) GPT-преобразование
-        final_text = refine_prompt_with_gpt(logic_text)
+    return prompt_record(pr, pid, final_text)
+
+
+def refine_prompts_in_batch(items):
+    """
+    Пакетный режим: все запросы стадии одним файлом Batch API, ответы
+    сопоставляются по custom_id. items — пары (номер, промпт); отдаёт записи по порядку.
+    """
+    logic_texts = [refine_prompt_logic(pr.get("text", "")) for _, pr in items]
+    requests = []
+    for (i, _), logic_text in zip(items, logic_texts):
+        request = build_refine_request(logic_text)
+        if request is not None:
+            requests.append((f"prompt-{i}", request))
+    responses = run_batch("refine_prompts", requests)
+
+    for (i, pr), logic_text in zip(items, logic_texts):
+        pid = pr.get("id", f"prompt_{i}")
+        response = responses.get(f"prompt-{i}")
+        yield prompt_record(pr, pid, response_text(response) if response else logic_text)
 
-        refined_prompts.append({"id": pid, "text": final_text})
 
-    # Сохраняем результат
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(refined_prompts, f, ensure_ascii=False, indent=4)
+def refine_prompts():
+    prompts = load_prompts()
+    if not prompts:
+        return
 
-    print(f"\n✅ Збережено {len(refined_prompts)} оновлених промптів у {OUTPUT_FILE}!")
+    # Уже обработанные в прерванном прогоне промпты пропускаем
+    manifest = RunManifest()
+    pending, resumed = split_pending(
+        manifest, "refine_prompts",
+        ((item_id(i, pr.get("text", "")), (i, pr)) for i, pr in enumerate(prompts))
+    )
+
+    if batch_enabled():
+        records = refine_prompts_in_batch([item for _, item in pending])
+    else:
+        records = (refine_prompt(pr, i, len(prompts)) for _, (i, pr) in pending)
+
+    with JsonlWriter(OUTPUT_FILE, "a" if resumed else "w") as writer:
+        for (iid, _), record in zip(pending, records):
+            writer.write(record)
+            manifest.mark_done("refine_prompts", iid)
+
+    finish_stage(manifest, "refine_prompts")
+    manifest.close()
+
+    print(f"\n✅ Збережено {writer.count} оновлених промптів у {OUTPUT_FILE}!")
+    report_cache_stats("refine_prompts")
+    export_metrics()
 
 
 if __name__ == "__main__":
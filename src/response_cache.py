@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+CACHE_FILE = os.getenv("GPT_CACHE_FILE", os.path.join(DATA_DIR, "gpt_cache.sqlite"))
+
+# rw — читаем и пишем, ro — только читаем, bypass — кеш выключен
+CACHE_MODE = os.getenv("GPT_CACHE_MODE", "rw")
+CACHE_MAX_BYTES = int(os.getenv("GPT_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+CACHE_MODES = ("rw", "ro", "bypass")
+# Пометка ответа, отданного из локального кеша: за него не платят, и в usage он не считается
+CACHE_HIT_KEY = "cache_hit"
+
+
+def cache_key(request):
+    """
+    Хеш запроса: model, messages, functions, temperature, max_tokens
+    и остальные параметры ChatCompletion, влияющие на ответ.
+    """
+    payload = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cache_hit(response):
+    return bool(response and response.get(CACHE_HIT_KEY))
+
+
+class ResponseCache:
+    """Постоянный кеш ответов ChatCompletion в SQLite с вытеснением LRU по размеру."""
+
+    def __init__(self, path=CACHE_FILE, mode=CACHE_MODE, max_bytes=CACHE_MAX_BYTES):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Невідомий режим кешу: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.total_bytes = 0
+
+        if mode == "bypass":
+            return
+        if mode == "ro":
+            if not os.path.exists(path):
+                return
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self.conn.commit()
+        row = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self.total_bytes = row[0]
+
+    def get(self, key, stage="gpt"):
+        if self.mode == "bypass":
+            return None
+        if self.conn is None:
+            self.misses[stage] += 1
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[stage] += 1
+                return None
+            self.hits[stage] += 1
+            if self.mode == "rw":
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, response):
+        if self.conn is None or self.mode != "rw":
+            return
+        value = json.dumps(response, ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Освобождаем с запасом до 90% лимита, чтобы не вытеснять на каждой записи
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_bytes -= size
+
+    def stats(self, stage):
+        return self.hits[stage], self.misses[stage]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def report_cache_stats(stage):
+    cache = get_cache()
+    if cache.mode == "bypass":
+        return
+    hits, misses = cache.stats(stage)
+    total = hits + misses
+    rate = (hits / total * 100) if total else 0.0
+    print(f"🗄 Кеш GPT [{stage}, {cache.mode}]: влучань {hits}, промахів {misses} ({rate:.1f}%)")
@@ -0,0 +1,110 @@
+import os
+import hashlib
+import threading
+from collections import defaultdict
+
+from jsonl_io import JsonlWriter, iter_jsonl
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data")
+MANIFEST_FILE = os.path.join(DATA_DIR, "run_manifest.jsonl")
+
+
+def item_id(index, text):
+    """
+    Идентификатор элемента стадии: позиция плюс хеш содержимого.
+    Если входной элемент изменился, он считается новым и будет обработан заново.
+    """
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    return f"{index}:{digest}"
+
+
+class RunManifest:
+    """
+    Журнал прогона: какие элементы каждой стадии уже готовы и какие стадии завершены.
+    Хранится как JSONL только на добавление, поэтому обрыв теряет лишь незаписанные строки.
+    """
+
+    def __init__(self, file_path=MANIFEST_FILE):
+        self.file_path = file_path
+        self.completed = defaultdict(set)
+        self.done_stages = set()
+        self.seed = None
+        self.lock = threading.Lock()
+        if os.path.exists(file_path):
+            for record in iter_jsonl(file_path):
+                self._apply(record)
+        self._writer = JsonlWriter(file_path, "a")
+
+    def _apply(self, record):
+        stage = record.get("stage")
+        if "seed" in record:
+            self.seed = record["seed"]
+        elif record.get("reset"):
+            self.completed.pop(stage, None)
+            self.done_stages.discard(stage)
+        elif record.get("done"):
+            self.done_stages.add(stage)
+        elif "item" in record:
+            self.completed[stage].add(record["item"])
+
+    def _append(self, record):
+        with self.lock:
+            self._apply(record)
+            self._writer.write(record)
+
+    def is_done(self, stage, item):
+        return item in self.completed[stage]
+
+    def mark_done(self, stage, item):
+        self._append({"stage": stage, "item": item})
+
+    def completed_count(self, stage):
+        return len(self.completed[stage])
+
+    def is_stage_done(self, stage):
+        return stage in self.done_stages
+
+    def mark_stage_done(self, stage):
+        self._append({"stage": stage, "done": True})
+
+    def reset_stage(self, stage):
+        self._append({"stage": stage, "reset": True})
+
+    def set_seed(self, seed):
+        """Сид прогона; при возобновлении используется записанный, а не новый."""
+        if self.seed != seed:
+            self._append({"seed": seed})
+
+    def close(self):
+        self._writer.close()
+
+
+def reset_manifest(file_path=MANIFEST_FILE):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def split_pending(manifest, stage, items):
+    """
+    Делит пары (item_id, item) на ещё не готовые. Если ни один из текущих
+    элементов не был готов, стадия начинается заново: возвращает (pending, resumed=False),
+    и вызывающий перезаписывает выходной файл вместо дописывания.
+    По завершении отдельного запуска стадии вызывающий сбрасывает её через
+    finish_stage, чтобы возобновлялись только прерванные запуски.
+    """
+    items = list(items)
+    pending = [(iid, item) for iid, item in items if not manifest.is_done(stage, iid)]
+    resumed = len(pending) < len(items)
+    if not resumed:
+        manifest.reset_stage(stage)
+    else:
+        print(f"⏭ [{stage}] пропущено {len(items) - len(pending)} вже готових елементів")
+    return pending, resumed
+
+
+def finish_stage(manifest, stage):
+    """
+    Отдельный запуск стадии дошёл до конца: её отметки сбрасываются, и повторный
+    запуск на тех же входных данных сгенерирует всё заново, а не пропустит готовое.
+    """
+    manifest.reset_stage(stage)
@@ -0,0 +1,60 @@
+import os
+import uuid
+import random
+import hashlib
+
+# Сид прогона; если не задан, выбирается случайно и печатается, чтобы прогон можно было повторить
+_ENV_SEED = os.getenv("RUN_SEED", "")
+
+_run_seed = None
+
+
+def get_run_seed():
+    global _run_seed
+    if _run_seed is None:
+        if _ENV_SEED:
+            _run_seed = int(_ENV_SEED)
+        else:
+            _run_seed = random.SystemRandom().getrandbits(32)
+            print(f"🎲 RUN_SEED={_run_seed} (задайте його, щоб повторити прогін)")
+    return _run_seed
+
+
+def set_run_seed(seed):
+    global _run_seed
+    _run_seed = int(seed)
+
+
+def item_rng(stage, index, seed=None):
+    """
+    Независимый генератор для элемента стадии: зависит только от (seed, stage, index),
+    поэтому результат не зависит от порядка и параллельности обработки, а любой
+    элемент можно перегенерировать отдельно.
+    """
+    if seed is None:
+        seed = get_run_seed()
+    digest = hashlib.sha256(f"{seed}:{stage}:{index}".encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:16], "big"))
+
+
+def item_rngs(stage, start, count, seed=None):
+    """
+    Генераторы элементов start..start+count-1 — те же состояния, что у item_rng, но
+    префикс хеша считается один раз, а объект Random один и пересевается на каждом
+    шаге: его нельзя сохранять между шагами.
+    """
+    if seed is None:
+        seed = get_run_seed()
+    prefix = hashlib.sha256(f"{seed}:{stage}:".encode("utf-8"))
+    rng = random.Random()
+    for index in range(start, start + count):
+        digest = prefix.copy()
+        digest.update(str(index).encode("utf-8"))
+        rng.seed(int.from_bytes(digest.digest()[:16], "big"))
+        yield rng
+
+
+def conversation_uuid(index, seed=None):
+    """Стабильный conversation_id (UUID версии 4) для диалога по номеру промпта."""
+    rng = item_rng("conversation_id", index, seed)
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import random
+
+from seeding import item_rng
+
+# SLOT_RESPONDER=1: ответы клиента на вопросы воронки записи (город, имя ребёнка,
+# телефон) берутся из полей персоны без вызова LLM
+SLOT_RESPONDER = os.getenv("SLOT_RESPONDER", "0") == "1"
+
+SLOT_TEMPLATES = {
+    "city": (
+        "{city}",
+        "{city}.",
+        "Я з міста {city}.",
+        "Живу в місті {city}.",
+        "Ми в місті {city}.",
+    ),
+    "child_name": (
+        "{child}",
+        "{child}.",
+        "Дитину звати {child}.",
+        "Ім'я дитини — {child}.",
+    ),
+    "phone": (
+        "{phone}",
+        "Мій номер {phone}.",
+        "Записуйте: {phone}.",
+        "Телефон {phone}.",
+    ),
+}
+
+
+def pick_child(children):
+    """Ребёнок, про которого спрашивает бот: первый подходящий по возрасту (5–12), иначе первый."""
+    for child in children:
+        if 5 <= child["age"] <= 12:
+            return child
+    return children[0] if children else None
+
+
+class PersonaResponder:
+    """Локальные ответы на слоты из полей персоны; None — поля нет, нужен ответ LLM."""
+
+    def __init__(self, person, rng=random):
+        self.person = person
+        self.rng = rng
+        self.answered = 0
+
+    def fields(self, slot):
+        person = self.person
+        if slot == "city" and person.get("city"):
+            return {"city": person["city"]}
+        if slot == "child_name":
+            child = pick_child(person.get("children") or [])
+            if child:
+                return {"child": child["name"]}
+        if slot == "phone" and person.get("phone"):
+            return {"phone": person["phone"]}
+        return None
+
+    def answer(self, slot):
+        fields = self.fields(slot)
+        if fields is None:
+            return None
+        self.answered += 1
+        return self.rng.choice(SLOT_TEMPLATES[slot]).format(**fields)
+
+
+def slot_responder(person, index=None, seed=None):
+    """Ответчик для диалога номер index; варианты шаблонов воспроизводимы по (сиду, номеру)."""
+    if not SLOT_RESPONDER or not person:
+        return None
+    rng = item_rng("slot_answers", index, seed) if index is not None else random
+    return PersonaResponder(person, rng)